@@ -1,4 +1,7 @@
+import atexit
 import logging
+import logging.handlers
+import queue
 from flask import Flask, render_template, request, Response, jsonify
 from prometheus_flask_exporter import PrometheusMetrics
 import sqlite3
@@ -9,6 +12,9 @@ import subprocess
 import signal
 import threading
 import time
+import json
+import urllib.request
+import urllib.error
 
 app = Flask(__name__)
 
@@ -17,13 +23,20 @@ log_dir = "/app/logs"
 os.makedirs(log_dir, exist_ok=True)
 log_file_path = os.path.join(log_dir, "app.log")
 
+# Request handlers only enqueue records; a listener thread does the file and console I/O
+log_formatter = logging.Formatter('%(asctime)s %(levelname)s %(name)s - %(message)s')
+file_handler = logging.FileHandler(log_file_path)
+file_handler.setFormatter(log_formatter)
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(log_formatter)
+log_queue = queue.Queue(-1)
+log_listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s %(levelname)s %(name)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file_path),
-        logging.StreamHandler()
-    ]
+    handlers=[logging.handlers.QueueHandler(log_queue)]
 )
 logger = logging.getLogger("FaceRecgApp")
 
@@ -36,6 +49,22 @@ metrics = PrometheusMetrics(app)
 recognition_process = None
 recognition_active = False
 
+# When set, start/stop talk to the pre-warmed recognition worker instead of docker exec
+RECOGNITION_WORKER_URL = os.environ.get("RECOGNITION_WORKER_URL")
+
+# Open /video_feed relays per page, so /status can tell a page whether its preview stream is still flowing
+preview_streams = {}
+preview_streams_lock = threading.Lock()
+
+def worker_request(path, method='GET', timeout=15):
+    req = urllib.request.Request(RECOGNITION_WORKER_URL.rstrip('/') + path, method=method, data=b'' if method == 'POST' else None)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return json.loads(resp.read().decode('utf-8'))
+    except urllib.error.HTTPError as e:
+        # The worker answers conflicts (already running, not running) with a JSON body
+        return json.loads(e.read().decode('utf-8'))
+
 def get_db_connection():
     db_path = os.path.join('/app/db', 'face_log.db')
     
@@ -97,6 +126,40 @@ def view_image(id):
         logger.error("Error in /view_image: %s", e)
         return f"Error retrieving image: {str(e)}", 500
 
+@app.route('/video_feed')
+@metrics.do_not_track()
+def video_feed():
+    # Relay the worker's MJPEG preview; closing the page closes the upstream viewer too
+    if not RECOGNITION_WORKER_URL:
+        return "Live preview needs RECOGNITION_WORKER_URL", 404
+    try:
+        upstream = urllib.request.urlopen(RECOGNITION_WORKER_URL.rstrip('/') + '/preview.mjpg', timeout=15)
+    except (urllib.error.URLError, OSError) as e:
+        logger.error("Error opening live preview: %s", e)
+        return f"Live preview unavailable: {str(e)}", 502
+
+    client = request.args.get('client')
+
+    def relay():
+        with preview_streams_lock:
+            preview_streams[client] = preview_streams.get(client, 0) + 1
+        try:
+            while True:
+                chunk = upstream.read1(64 * 1024)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            upstream.close()
+            with preview_streams_lock:
+                preview_streams[client] -= 1
+                if not preview_streams[client]:
+                    del preview_streams[client]
+
+    logger.info("Serving live preview")
+    return Response(relay(), mimetype=upstream.headers.get('Content-Type'),
+                    headers={"Cache-Control": "no-cache, no-store"})
+
 def is_container_running(container_name='recognition'):
     result = subprocess.run(
         ['docker', 'inspect', '-f', '{{.State.Running}}', container_name],
@@ -117,6 +180,15 @@ def start_recognition():
         return jsonify({"status": "error", "message": "Recognition already running"})
     
     try:
+        if RECOGNITION_WORKER_URL:
+            result = worker_request('/start', method='POST')
+            recognition_active = result.get("status") == "success"
+            if recognition_active:
+                logger.info("Recognition worker attached: %s", result.get("message"))
+            else:
+                logger.error("Recognition worker failed to start: %s", result.get("message"))
+            return jsonify(result)
+
         if not is_container_running('recognition'):
             start_proc = subprocess.run(
                 ['docker', 'start', 'recognition'],
@@ -132,8 +204,10 @@ def start_recognition():
                 })
             logger.info("Recognition container started")
         
+        # The container's own recognition_worker.py holds 5002, so the exec'd service exports metrics elsewhere
         process = subprocess.Popen(
-            ["docker", "exec", "-d", "recognition", "python", "/app/recognition_service.py"],
+            ["docker", "exec", "-d", "-e", "RECOGNITION_METRICS_PORT=5003",
+             "recognition", "python", "/app/recognition_service.py"],
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE
         )
@@ -178,6 +252,16 @@ def stop_recognition():
         return jsonify({"status": "error", "message": "Recognition not running"})
     
     try:
+        if RECOGNITION_WORKER_URL:
+            result = worker_request('/stop', method='POST')
+            # A stop that timed out leaves the worker running
+            recognition_active = bool(result.get("recognition_active"))
+            if result.get("status") == "success":
+                logger.info("Recognition worker detached: %s", result.get("message"))
+            else:
+                logger.error("Recognition worker failed to stop: %s", result.get("message"))
+            return jsonify(result)
+
         process = subprocess.Popen(
             ["docker", "exec", "recognition", "pkill", "-f", "python /app/recognition_service.py"],
             stdout=subprocess.PIPE,
@@ -247,15 +331,18 @@ def status():
             logger.error("Error checking database status: %s", e)
             db_exists = False
     
+    global recognition_active
     try:
-        process = subprocess.Popen(
-            ["docker", "exec", "recognition", "pgrep", "-f", "python /app/recognition_service.py"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        stdout, stderr = process.communicate()
-        global recognition_active
-        recognition_active = process.returncode == 0
+        if RECOGNITION_WORKER_URL:
+            recognition_active = bool(worker_request('/status').get("recognition_active"))
+        else:
+            process = subprocess.Popen(
+                ["docker", "exec", "recognition", "pgrep", "-f", "python /app/recognition_service.py"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
+            stdout, stderr = process.communicate()
+            recognition_active = process.returncode == 0
         logger.info("Recognition active status checked: %s", recognition_active)
     except Exception as e:
         logger.error("Error checking recognition status: %s", e)
@@ -264,7 +351,9 @@ def status():
         "models_exist": models_exist,
         "db_exists": db_exists,
         "record_count": record_count,
-        "recognition_active": recognition_active
+        "recognition_active": recognition_active,
+        "preview_available": bool(RECOGNITION_WORKER_URL),
+        "preview_streaming": request.args.get('preview_client') in preview_streams
     })
 
 if __name__ == '__main__':
@@ -0,0 +1,58 @@
+import dlib
+import numpy as np
+import face_recognition.api as fr_api
+
+ENCODING_SIZE = 128
+CHIP_SIZE = 150
+CHIP_PADDING = 0.25
+
+
+class BatchEncoder:
+    """Computes face descriptors for many faces in one ResNet call.
+
+    face_recognition.face_encodings() runs the descriptor network once per
+    face. Here add() only finds landmarks and cuts the aligned 150x150 chip
+    for each box (the same alignment dlib does internally), and flush()
+    pushes every queued chip through the network as one batch, writing the
+    descriptors into a preallocated array.
+    """
+
+    def __init__(self, capacity=32, num_jitters=1):
+        self.num_jitters = num_jitters
+        self.out = np.empty((capacity, ENCODING_SIZE), dtype=np.float64)
+        self._chips = []
+        self._spans = []
+
+    def __len__(self):
+        return len(self._chips)
+
+    def add(self, rgb, boxes):
+        """Queue the faces in `boxes` of one RGB frame; returns a ticket for flush()."""
+        ticket = len(self._spans)
+        start = len(self._chips)
+        if boxes:
+            shapes = dlib.full_object_detections()
+            for landmarks in fr_api._raw_face_landmarks(rgb, boxes, model="small"):
+                shapes.append(landmarks)
+            self._chips.extend(dlib.get_face_chips(rgb, shapes, size=CHIP_SIZE, padding=CHIP_PADDING))
+        self._spans.append((start, len(self._chips) - start))
+        return ticket
+
+    def flush(self):
+        """Encode every queued face; returns one (n_faces, 128) array per ticket.
+
+        The arrays are views into the output buffer and are overwritten by
+        the next flush().
+        """
+        count = len(self._chips)
+        if count > len(self.out):
+            self.out = np.empty((max(count, 2 * len(self.out)), ENCODING_SIZE), dtype=np.float64)
+        if count:
+            descriptors = fr_api.face_encoder.compute_face_descriptor(self._chips, self.num_jitters)
+            for i, descriptor in enumerate(descriptors):
+                self.out[i] = descriptor
+
+        results = [self.out[start:start + n] for start, n in self._spans]
+        self._chips = []
+        self._spans = []
+        return results
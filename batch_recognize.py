@@ -0,0 +1,334 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import cv2
+
+from compact_gallery import CompactGallery
+from detector import detect_faces_batch
+from gallery import Gallery
+from ingest import IMAGE_EXTENSIONS
+from labels import LABEL_MAP
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='[%(asctime)s] %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+TIMEZONE = ZoneInfo("Asia/Kolkata")
+
+# How far before a unit's first frame to seek, so an early-landing seek still decodes up to it
+SEEK_MARGIN_MS = 2000
+
+# Set in the parent before the pool forks, so workers share the loaded gallery
+_job = {}
+
+
+def ensure_schema(conn):
+    # Same face_log as the live recognizer, plus where each offline row came from
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS face_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        frame BLOB NOT NULL
+    )
+    ''')
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(face_log)")}
+    if "source" not in columns:
+        conn.execute("ALTER TABLE face_log ADD COLUMN source TEXT")
+    if "frame_offset" not in columns:
+        conn.execute("ALTER TABLE face_log ADD COLUMN frame_offset INTEGER")
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS batch_progress (
+        unit TEXT PRIMARY KEY,
+        next_position INTEGER NOT NULL,
+        frames INTEGER NOT NULL DEFAULT 0,
+        faces INTEGER NOT NULL DEFAULT 0,
+        done INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    # Stills are tracked one file at a time, so files added to a folder between runs don't shift other work
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS batch_images (
+        path TEXT NOT NULL,
+        mtime REAL NOT NULL,
+        PRIMARY KEY (path, mtime)
+    )
+    ''')
+    # Workers write concurrently with each other and with a live recognizer
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.commit()
+
+def plan_units(inputs, chunk_seconds, shard_size, done_images=frozenset()):
+    """Split the inputs into independent work units.
+
+    Videos become chunks of chunk_seconds. Their unit ids are derived from
+    the path and start frame, so a rerun with the same chunking resumes the
+    same units. Folders of stills become shards of shard_size files, but
+    progress is kept per (path, mtime) in batch_images: files listed in
+    done_images are left out before sharding, so image unit ids are only
+    labels for this run and a folder that gained or changed files since
+    the last run picks up exactly those.
+    """
+    units = []
+    for path in inputs:
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            files = sorted(
+                os.path.join(root, name)
+                for root, _, names in os.walk(path)
+                for name in names if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+            pending = [(file, os.path.getmtime(file)) for file in files]
+            pending = [item for item in pending if item not in done_images]
+            if len(pending) < len(files):
+                logging.info(f"{path}: {len(files) - len(pending)} of {len(files)} images already processed")
+            for start in range(0, len(pending), shard_size):
+                units.append({
+                    "id": f"{path}#{start}", "kind": "images",
+                    "files": [file for file, _ in pending[start:start + shard_size]]
+                })
+            continue
+
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            logging.error(f"Could not open video {path}, skipping it")
+            continue
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        # Recordings are closed when they end, so the file time marks the last frame
+        recorded_at = os.path.getmtime(path) - frame_count / fps
+        chunk_frames = max(1, int(chunk_seconds * fps))
+        starts = list(range(0, max(frame_count, 1), chunk_frames))
+        for i, start in enumerate(starts):
+            # The container's frame count can be off, so the last chunk reads to the end of the file
+            end = starts[i + 1] if i + 1 < len(starts) else None
+            units.append({
+                "id": f"{path}@{start}", "kind": "video", "source": path, "start": start, "end": end,
+                "fps": fps, "recorded_at": recorded_at
+            })
+    return units
+
+def iter_unit_frames(unit, position, stride):
+    """Yield (position, source, frame_offset, epoch seconds, frame) from position onwards.
+
+    Seeking is not frame-accurate for every codec or for variable frame rate
+    files, so video frames are identified by their own decode timestamp
+    (as a frame index at the nominal rate) rather than by counting from
+    the seek point. Neighbouring units therefore neither overlap nor leave
+    gaps, whatever frame the seek actually lands on.
+    """
+    if unit["kind"] == "images":
+        for index in range(position, len(unit["files"])):
+            path = unit["files"][index]
+            frame = cv2.imread(path)
+            if frame is None:
+                logging.warning(f"Could not read image {path}, skipping it")
+                continue
+            yield index, path, 0, os.path.getmtime(path), frame
+        return
+
+    fps = unit["fps"]
+    cap = cv2.VideoCapture(unit["source"])
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open video {unit['source']}")
+    try:
+        if position:
+            cap.set(cv2.CAP_PROP_POS_MSEC, max(0.0, position / fps * 1000 - SEEK_MARGIN_MS))
+        check_overshoot = position > 0
+        while cap.grab():
+            offset = round(cap.get(cv2.CAP_PROP_POS_MSEC) * fps / 1000)
+            if check_overshoot:
+                check_overshoot = False
+                if offset > position:
+                    # The seek landed past the first frame we need; decode from the start instead
+                    logging.warning(f"Seek in {unit['source']} overshot frame {position}, decoding from the start")
+                    cap.release()
+                    cap = cv2.VideoCapture(unit["source"])
+                    continue
+            if unit["end"] is not None and offset >= unit["end"]:
+                return
+            if offset < position or offset % stride:
+                continue
+            # grab() already decoded the frame, retrieve() only converts it
+            ret, frame = cap.retrieve()
+            if not ret:
+                return
+            yield offset, unit["source"], offset, unit["recorded_at"] + offset / fps, frame
+    finally:
+        cap.release()
+
+def _init_worker():
+    # One process per core already, extra OpenCV threads would only contend
+    cv2.setNumThreads(1)
+
+def _write_batch(conn, unit, batch):
+    frames = [item[-1] for item in batch]
+    detections = detect_faces_batch(frames, scale=_job["scale"])
+
+    # Match the faces of the whole batch in one call
+    encodings = [encoding for _, face_encodings in detections for encoding in face_encodings]
+    names = iter(_job["gallery"].match_batch(encodings, tolerance=_job["tolerance"]) if encodings else [])
+
+    rows = []
+    for (position, source, frame_offset, seconds, frame), (boxes, _) in zip(batch, detections):
+        if not boxes:
+            continue
+        frame_names = [next(names) for _ in boxes]
+        timestamp = datetime.fromtimestamp(seconds, TIMEZONE).strftime("%Y-%m-%d %H:%M:%S")
+        # One PNG per frame, shared by every face seen in it
+        success, encoded_image = cv2.imencode('.png', frame)
+        if not success:
+            logging.warning(f"Could not encode frame {frame_offset} of {source}")
+            continue
+        frame_bytes = encoded_image.tobytes()
+        for raw_name in frame_names:
+            name = "Unseen" if raw_name is None else LABEL_MAP.get(raw_name, raw_name)
+            rows.append((name, timestamp, frame_bytes, source, frame_offset))
+
+    # Rows and progress commit together, so a crash never logs a frame twice or loses one
+    with conn:
+        conn.executemany(
+            'INSERT INTO face_log (name, timestamp, frame, source, frame_offset) VALUES (?, ?, ?, ?, ?)',
+            rows
+        )
+        if unit["kind"] == "images":
+            conn.executemany(
+                'INSERT OR IGNORE INTO batch_images (path, mtime) VALUES (?, ?)',
+                [(source, seconds) for _, source, _, seconds, _ in batch]
+            )
+        else:
+            conn.execute(
+                'UPDATE batch_progress SET next_position = ?, frames = frames + ?, faces = faces + ? WHERE unit = ?',
+                (batch[-1][0] + 1, len(batch), len(rows), unit["id"])
+            )
+    return len(rows)
+
+def run_unit(unit, position):
+    """Process one unit from position onwards; returns (unit id, frames, faces, seconds, error)."""
+    start = time.perf_counter()
+    frames = faces = 0
+    conn = sqlite3.connect(_job["db_path"], timeout=60)
+    try:
+        batch = []
+        for item in iter_unit_frames(unit, position, _job["stride"]):
+            batch.append(item)
+            if len(batch) == _job["batch_frames"]:
+                faces += _write_batch(conn, unit, batch)
+                frames += len(batch)
+                batch = []
+        if batch:
+            faces += _write_batch(conn, unit, batch)
+            frames += len(batch)
+        if unit["kind"] == "video":
+            with conn:
+                conn.execute('UPDATE batch_progress SET done = 1 WHERE unit = ?', (unit["id"],))
+        return unit["id"], frames, faces, time.perf_counter() - start, None
+    except Exception as e:
+        # Leave the unit unfinished; its committed batches are kept and a rerun picks up after them
+        return unit["id"], frames, faces, time.perf_counter() - start, str(e)
+    finally:
+        conn.close()
+
+def _run_unit_args(args):
+    return run_unit(*args)
+
+def recognize(inputs, db_path, encodings_path, mode="float64", workers=None, chunk_seconds=60.0,
+              shard_size=200, stride=1, batch_frames=8, scale=1.0, tolerance=0.5):
+    conn = sqlite3.connect(db_path, timeout=60)
+    try:
+        ensure_schema(conn)
+        done_images = set(conn.execute('SELECT path, mtime FROM batch_images'))
+        units = plan_units(inputs, chunk_seconds, shard_size, done_images)
+        videos = [unit for unit in units if unit["kind"] == "video"]
+        with conn:
+            conn.executemany(
+                'INSERT OR IGNORE INTO batch_progress (unit, next_position) VALUES (?, ?)',
+                [(unit["id"], unit["start"]) for unit in videos]
+            )
+        progress = {
+            unit: (next_position, done)
+            for unit, next_position, done in conn.execute('SELECT unit, next_position, done FROM batch_progress')
+        }
+    finally:
+        conn.close()
+
+    # Image units only hold files not processed yet, they always start from their first file
+    pending = [
+        (unit, progress[unit["id"]][0] if unit["kind"] == "video" else 0)
+        for unit in units if unit["kind"] == "images" or not progress[unit["id"]][1]
+    ]
+    if len(pending) < len(units):
+        logging.info(f"Resuming: {len(units) - len(pending)} of {len(videos)} video units already done")
+    if not pending:
+        return 0
+
+    _job.update(
+        gallery=Gallery.load(encodings_path) if mode == "float64" else CompactGallery.load(encodings_path, mode=mode),
+        db_path=db_path, stride=max(1, stride), batch_frames=max(1, batch_frames), scale=scale, tolerance=tolerance
+    )
+    workers = min(workers or os.cpu_count(), len(pending))
+    logging.info(f"Processing {len(pending)} units with {workers} workers against {len(_job['gallery'])} encodings")
+
+    start = time.perf_counter()
+    total_frames = total_faces = failed = 0
+    with multiprocessing.get_context("fork").Pool(workers, initializer=_init_worker) as pool:
+        for done, (unit_id, frames, faces, seconds, error) in enumerate(
+                pool.imap_unordered(_run_unit_args, pending), 1):
+            total_frames += frames
+            total_faces += faces
+            elapsed = time.perf_counter() - start
+            if error:
+                failed += 1
+                logging.error(f"[{done}/{len(pending)}] {unit_id} failed after {frames} frames: {error}")
+                continue
+            logging.info(
+                f"[{done}/{len(pending)}] {unit_id}: {frames} frames, {faces} faces, "
+                f"{frames / seconds if seconds else 0:.1f} frames/sec; overall {total_frames / elapsed:.1f} frames/sec"
+            )
+
+    elapsed = time.perf_counter() - start
+    logging.info(
+        f"Batch recognition finished: {total_frames} frames, {total_faces} faces logged in {elapsed:.1f}s "
+        f"({total_frames / elapsed:.1f} frames/sec, {workers} workers, {failed} units failed)"
+    )
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Recognize faces in recorded videos and image folders in parallel")
+    parser.add_argument("inputs", nargs="+", help="Video files and/or directories of images")
+    parser.add_argument("--db", default="/app/db/face_log.db")
+    parser.add_argument("--encodings", default="/app/models/encodings.pkl")
+    parser.add_argument("--gallery-mode", default=os.environ.get("RECOGNITION_GALLERY_MODE", "float64"),
+                        choices=["float64", "float16", "int8", "pq"])
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument("--chunk-seconds", type=float, default=60.0, help="Length of each video work unit")
+    parser.add_argument("--shard-size", type=int, default=200, help="Not yet processed images per work unit")
+    parser.add_argument("--stride", type=int, default=1, help="Only process every n-th video frame")
+    parser.add_argument("--batch-frames", type=int, default=8, help="Frames encoded and committed together")
+    parser.add_argument("--scale", type=float, default=1.0, help="Detection scale")
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    args = parser.parse_args()
+
+    try:
+        failed = recognize(args.inputs, args.db, args.encodings, args.gallery_mode, args.workers,
+                           args.chunk_seconds, args.shard_size, args.stride, args.batch_frames,
+                           args.scale, args.tolerance)
+    except sqlite3.Error as e:
+        logging.error(f"Database error: {e}")
+        sys.exit(1)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
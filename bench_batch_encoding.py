@@ -0,0 +1,65 @@
+import argparse
+import logging
+import time
+
+import numpy as np
+import face_recognition
+
+from batch_encoder import BatchEncoder
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='[%(asctime)s] %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+def best_of(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-face and batched face encoding cost")
+    parser.add_argument("image", help="Image with at least one face; its faces are repeated to fill each batch")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    rgb = face_recognition.load_image_file(args.image)
+    faces = face_recognition.face_locations(rgb)
+    if not faces:
+        logging.error(f"No faces found in {args.image}")
+        return
+    logging.info(f"Found {len(faces)} faces in {args.image}")
+
+    encoder = BatchEncoder(capacity=max(args.batch_sizes))
+
+    # Both paths must agree before their timings mean anything
+    reference = np.array(face_recognition.face_encodings(rgb, faces))
+    encoder.add(rgb, faces)
+    batched = encoder.flush()[0]
+    logging.info(f"Max abs difference between paths: {np.abs(reference - batched).max():.2e}")
+
+    for size in args.batch_sizes:
+        boxes = [faces[i % len(faces)] for i in range(size)]
+
+        def per_face():
+            face_recognition.face_encodings(rgb, boxes)
+
+        def batch():
+            encoder.add(rgb, boxes)
+            encoder.flush()
+
+        per_face_ms = best_of(per_face, args.repeats) / size * 1000
+        batch_ms = best_of(batch, args.repeats) / size * 1000
+        logging.info(
+            f"batch={size:3d}: per-face path {per_face_ms:.2f}ms/face, "
+            f"batched path {batch_ms:.2f}ms/face, speedup={per_face_ms / batch_ms:.2f}x"
+        )
+
+if __name__ == "__main__":
+    main()
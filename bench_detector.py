@@ -0,0 +1,94 @@
+import argparse
+import logging
+import time
+
+import cv2
+import numpy as np
+
+from detector import DETECTORS, locate_faces
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='[%(asctime)s] %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+def iou(a, b):
+    top, right, bottom, left = max(a[0], b[0]), min(a[1], b[1]), min(a[2], b[2]), max(a[3], b[3])
+    inter = max(0, bottom - top) * max(0, right - left)
+    area = lambda box: (box[2] - box[0]) * (box[1] - box[3])
+    return inter / float(area(a) + area(b) - inter) if inter else 0.0
+
+def matched(reference, boxes, threshold):
+    # Greedy one-to-one matching, enough for the handful of faces in a frame
+    unused = list(boxes)
+    hits = 0
+    for ref in reference:
+        scores = [iou(ref, box) for box in unused]
+        if scores and max(scores) >= threshold:
+            unused.pop(int(np.argmax(scores)))
+            hits += 1
+    return hits
+
+def read_frames(clip_path, max_frames, stride):
+    cap = cv2.VideoCapture(clip_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open clip {clip_path}")
+    index = 0
+    try:
+        while max_frames is None or index < max_frames * stride:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if index % stride == 0:
+                yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            index += 1
+    finally:
+        cap.release()
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare cascaded detection with single-stage HOG on recorded footage")
+    parser.add_argument("clip", help="Recorded video; the HOG detections on each frame are the reference")
+    parser.add_argument("--max-frames", type=int, default=300)
+    parser.add_argument("--stride", type=int, default=1, help="Use every n-th frame")
+    parser.add_argument("--scale", type=float, default=1.0, help="Detection scale, as set by load shedding")
+    parser.add_argument("--iou", type=float, default=0.5, help="Overlap at which a box counts as the same face")
+    args = parser.parse_args()
+
+    detectors = {name: cls() for name, cls in DETECTORS.items()}
+    latencies = {name: [] for name in detectors}
+    found = {name: 0 for name in detectors}
+    hits = {name: 0 for name in detectors}
+    reference_total = 0
+    frames = 0
+
+    for rgb in read_frames(args.clip, args.max_frames, args.stride):
+        results = {}
+        for name, detector in detectors.items():
+            start = time.perf_counter()
+            results[name] = locate_faces(rgb, scale=args.scale, detector=detector)
+            latencies[name].append((time.perf_counter() - start) * 1000)
+        reference = results["hog"]
+        reference_total += len(reference)
+        for name, boxes in results.items():
+            found[name] += len(boxes)
+            hits[name] += matched(reference, boxes, args.iou)
+        frames += 1
+
+    if not frames:
+        logging.error(f"No frames read from {args.clip}")
+        return
+
+    logging.info(f"{frames} frames, {reference_total} faces found by single-stage HOG")
+    for name, costs in latencies.items():
+        costs = np.array(costs)
+        recall = hits[name] / reference_total * 100 if reference_total else 100.0
+        logging.info(
+            f"{name:>8}: mean={costs.mean():.1f}ms p50={np.percentile(costs, 50):.1f}ms "
+            f"p95={np.percentile(costs, 95):.1f}ms recall={recall:.1f}% "
+            f"boxes={found[name]} unmatched={found[name] - hits[name]}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import logging
+import os
+import time
+
+import cv2
+
+from detector import detect_faces
+from frame_pool import DetectionPool
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='[%(asctime)s] %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+def load_clip(clip_path, max_frames):
+    # Decode up front so capture speed doesn't limit the measurement
+    cap = cv2.VideoCapture(clip_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open clip {clip_path}")
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+def run_in_process(frames):
+    start = time.perf_counter()
+    for frame in frames:
+        detect_faces(frame)
+    return len(frames) / (time.perf_counter() - start)
+
+def run_pool(frames, workers):
+    pool = DetectionPool(workers, frames[0].shape)
+    try:
+        # Let every worker fork and attach before timing
+        pool.submit(frames[0])
+        pool.next_result()
+
+        start = time.perf_counter()
+        for frame in frames:
+            pool.submit(frame)
+            if pool.full:
+                pool.next_result()
+        while pool.pending:
+            pool.next_result()
+        return len(frames) / (time.perf_counter() - start)
+    finally:
+        pool.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure detection throughput of the shared memory process pool")
+    parser.add_argument("clip", help="Path to a recorded video to replay")
+    parser.add_argument("--max-frames", type=int, default=300)
+    parser.add_argument("--workers", type=int, nargs="+", default=None,
+                        help="Worker counts to try (default: 1, 2, 4, ... up to the core count)")
+    args = parser.parse_args()
+
+    frames = load_clip(args.clip, args.max_frames)
+    logging.info(f"Loaded {len(frames)} frames of shape {frames[0].shape} from {args.clip}")
+
+    baseline = run_in_process(frames)
+    logging.info(f"in-process: {baseline:.1f} frames/sec")
+
+    worker_counts = args.workers
+    if worker_counts is None:
+        cores = os.cpu_count() or 1
+        worker_counts = sorted({min(2 ** i, cores) for i in range(cores.bit_length() + 1)})
+
+    for workers in worker_counts:
+        fps = run_pool(frames, workers)
+        speedup = fps / baseline
+        logging.info(
+            f"pool workers={workers}: {fps:.1f} frames/sec, speedup={speedup:.2f}x, "
+            f"efficiency={speedup / workers * 100:.0f}%"
+        )
+
+if __name__ == "__main__":
+    main()
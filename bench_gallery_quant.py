@@ -0,0 +1,79 @@
+import argparse
+import logging
+import time
+
+import numpy as np
+
+from bench_sharded_matching import synthetic_gallery
+from compact_gallery import CODECS, CompactGallery
+from gallery import Gallery
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='[%(asctime)s] %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+def make_queries(gallery, count, noise, rng):
+    # Half are noisy copies of known faces, half are strangers far from every identity
+    known = gallery.encodings[rng.integers(0, len(gallery), size=count // 2)]
+    known = known + rng.normal(0, noise, size=known.shape)
+    strangers = rng.normal(0, 0.09, size=(count - len(known), 128))
+    return np.vstack([known, strangers])
+
+def decide(candidates, tolerance):
+    return candidates[0][1] if candidates and candidates[0][0] <= tolerance else None
+
+def evaluate(label, gallery, queries, tolerance):
+    reference = gallery.topk(queries, 1)
+    reference_names = [r[0][1] for r in reference]
+    reference_decisions = [decide(r, tolerance) for r in reference]
+
+    rows = []
+    for mode in ["float64"] + list(CODECS):
+        start = time.perf_counter()
+        compact = gallery if mode == "float64" else CompactGallery.from_gallery(gallery, mode=mode)
+        build_s = time.perf_counter() - start
+
+        latencies = []
+        results = []
+        for query in queries:
+            start = time.perf_counter()
+            results.append(compact.topk(query, 1)[0])
+            latencies.append(time.perf_counter() - start)
+
+        top1 = np.mean([r[0][1] == name for r, name in zip(results, reference_names)])
+        decisions = np.mean([decide(r, tolerance) == want for r, want in zip(results, reference_decisions)])
+        distance_error = np.mean([abs(r[0][0] - ref[0][0]) for r, ref in zip(results, reference)])
+        rows.append((mode, compact.memory_bytes(), build_s, np.median(latencies) * 1000, top1, decisions, distance_error))
+
+    logging.info(f"{label}: {len(gallery)} encodings, {len(queries)} queries, tolerance {tolerance}")
+    logging.info(f"{'mode':>8} {'bytes/enc':>10} {'total MB':>9} {'build s':>8} {'query ms':>9} "
+                 f"{'top-1':>7} {'decision':>9} {'dist err':>9}")
+    for mode, memory, build_s, query_ms, top1, decisions, distance_error in rows:
+        logging.info(
+            f"{mode:>8} {memory / len(gallery):>10.1f} {memory / 1e6:>9.2f} {build_s:>8.2f} {query_ms:>9.3f} "
+            f"{top1 * 100:>6.1f}% {decisions * 100:>8.1f}% {distance_error:>9.4f}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare compact gallery modes against float64")
+    parser.add_argument("--encodings", help="Real encodings.pkl to evaluate in addition to the synthetic gallery")
+    parser.add_argument("--identities", type=int, default=5000)
+    parser.add_argument("--per-identity", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.02, help="Std-dev added to known faces to form queries")
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    synthetic = synthetic_gallery(args.identities, args.per_identity)
+    evaluate("synthetic", synthetic, make_queries(synthetic, args.queries, args.noise, rng), args.tolerance)
+
+    if args.encodings:
+        real = Gallery.load(args.encodings)
+        evaluate("real", real, make_queries(real, args.queries, args.noise, rng), args.tolerance)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import logging
+import os
+import tempfile
+import time
+from collections import Counter
+
+import cv2
+import numpy as np
+
+from recognition_service import FaceRecognizer
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='[%(asctime)s] %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+def replay(recognizer, clip_path, max_frames=None):
+    # Run the recognition pipeline over a recorded clip and collect per-frame cost
+    cap = cv2.VideoCapture(clip_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open clip {clip_path}")
+
+    costs = []
+    levels = Counter()
+    try:
+        while max_frames is None or len(costs) < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            start = time.perf_counter()
+            recognizer.process_frame(frame, log_faces=False)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if recognizer.shedder is not None:
+                recognizer.shedder.record(elapsed_ms)
+                levels[recognizer.shedder.level] += 1
+            costs.append(elapsed_ms)
+    finally:
+        cap.release()
+    return np.array(costs), levels
+
+def report(label, costs, target_ms, levels=None):
+    over = float(np.mean(costs > target_ms)) * 100 if len(costs) else 0.0
+    logging.info(
+        f"{label}: frames={len(costs)} mean={costs.mean():.1f}ms p50={np.percentile(costs, 50):.1f}ms "
+        f"p95={np.percentile(costs, 95):.1f}ms max={costs.max():.1f}ms over_target={over:.1f}%"
+    )
+    if levels:
+        histogram = ", ".join(f"L{level}={count}" for level, count in sorted(levels.items()))
+        logging.info(f"{label}: frames per shedding level: {histogram}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate load shedding against a replayed crowded clip")
+    parser.add_argument("clip", help="Path to a recorded video with several faces in view")
+    parser.add_argument("--models-dir", default="/app/models")
+    parser.add_argument("--target-ms", type=float, default=150.0)
+    parser.add_argument("--max-frames", type=int, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        event_log_path = os.path.join(db_dir, "events.jsonl")
+        baseline = FaceRecognizer(models_dir=args.models_dir, db_dir=db_dir, latency_target_ms=0,
+                                  event_log_path=event_log_path)
+        costs, _ = replay(baseline, args.clip, args.max_frames)
+        report("baseline", costs, args.target_ms)
+
+        shedding = FaceRecognizer(models_dir=args.models_dir, db_dir=db_dir, latency_target_ms=args.target_ms,
+                                  event_log_path=event_log_path)
+        costs, levels = replay(shedding, args.clip, args.max_frames)
+        report("shedding", costs, args.target_ms, levels)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from gallery import Gallery
+from shard_matcher import ShardedMatcher, spawn_local
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='[%(asctime)s] %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+def synthetic_gallery(identities, per_identity, seed=0):
+    # Clustered unit-scale vectors roughly shaped like dlib descriptors
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 0.09, size=(identities, 128))
+    encodings = np.repeat(centers, per_identity, axis=0) + rng.normal(0, 0.02, size=(identities * per_identity, 128))
+    names = [str(i) for i in range(identities) for _ in range(per_identity)]
+    return Gallery(encodings, names)
+
+def main():
+    parser = argparse.ArgumentParser(description="Check sharded matching against a single gallery on local matcher processes")
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--encodings", help="encodings.pkl to shard (default: a synthetic gallery)")
+    parser.add_argument("--identities", type=int, default=2000)
+    parser.add_argument("--per-identity", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=4, help="Faces per frame sent in one scatter")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--timeout-ms", type=float, default=200.0)
+    parser.add_argument("--base-port", type=int, default=6100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        encodings_path = args.encodings
+        if encodings_path is None:
+            encodings_path = os.path.join(tmp_dir, "encodings.pkl")
+            synthetic_gallery(args.identities, args.per_identity).save(encodings_path)
+        gallery = Gallery.load(encodings_path)
+        logging.info(f"Gallery of {len(gallery)} encodings, {len(set(gallery.names))} identities")
+
+        processes, addresses = spawn_local(encodings_path, args.shards, base_port=args.base_port)
+        matcher = ShardedMatcher(addresses, timeout=args.timeout_ms / 1000)
+        try:
+            rng = np.random.default_rng(1)
+            mismatches = 0
+            single_times, sharded_times = [], []
+            for _ in range(args.frames):
+                picks = rng.integers(0, len(gallery), size=args.batch)
+                queries = gallery.encodings[picks] + rng.normal(0, 0.02, size=(args.batch, 128))
+
+                start = time.perf_counter()
+                expected = gallery.topk(queries, 3)
+                single_times.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                merged = matcher.topk(queries, 3)
+                sharded_times.append(time.perf_counter() - start)
+
+                for want, got in zip(expected, merged):
+                    if [name for _, name in want] != [name for _, name in got]:
+                        mismatches += 1
+
+            logging.info(f"Top-3 mismatches against the single gallery: {mismatches}/{args.frames * args.batch}")
+            logging.info(
+                f"single: p50={np.percentile(single_times, 50) * 1000:.2f}ms per batch, "
+                f"sharded x{args.shards}: p50={np.percentile(sharded_times, 50) * 1000:.2f}ms "
+                f"p95={np.percentile(sharded_times, 95) * 1000:.2f}ms per batch"
+            )
+        finally:
+            matcher.close()
+            for process in processes:
+                process.terminate()
+
+if __name__ == "__main__":
+    main()
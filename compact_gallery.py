@@ -0,0 +1,320 @@
+import os
+import pickle
+
+import numpy as np
+
+from gallery import ENCODING_SIZE, Gallery, as_matrix, shard_for
+
+# Rows cast back to float32 at a time, bounds the temporary memory of a distance scan
+CHUNK_ROWS = 8192
+# Retrain the codec once the rows added since training reach this fraction of the rows it was trained on
+REFIT_GROWTH = 0.125
+
+
+def _chunked_cross(codes, weights):
+    """codes (n, d) of any dtype @ weights (d, m) in float32, CHUNK_ROWS rows at a time."""
+    out = np.empty((len(codes), weights.shape[1]), dtype=np.float32)
+    for start in range(0, len(codes), CHUNK_ROWS):
+        out[start:start + CHUNK_ROWS] = codes[start:start + CHUNK_ROWS].astype(np.float32) @ weights
+    return out
+
+
+class Float16Codec:
+    """Half precision vectors plus their float32 squared norms: 260 bytes per encoding."""
+
+    name = "float16"
+    # Nothing is learned from the data, so any number of rows can be encoded as they arrive
+    min_rows = 0
+    adaptive = False
+
+    def fit(self, encodings):
+        pass
+
+    def encode(self, encodings):
+        codes = encodings.astype(np.float16)
+        as_float = codes.astype(np.float32)
+        return codes, np.einsum("ij,ij->i", as_float, as_float)
+
+    def decode(self, store):
+        return store[0].astype(np.float64)
+
+    def concat(self, store, more):
+        return np.vstack([store[0], more[0]]), np.concatenate([store[1], more[1]])
+
+    def take(self, store, rows):
+        return store[0][rows], store[1][rows]
+
+    def squared_distances(self, store, queries):
+        codes, norms = store
+        queries = queries.astype(np.float32)
+        cross = _chunked_cross(codes, queries.T).T
+        squared = np.einsum("ij,ij->i", queries, queries)[:, None] + norms[None, :] - 2 * cross
+        return np.maximum(squared, 0)
+
+    def nbytes(self, store):
+        return store[0].nbytes + store[1].nbytes
+
+
+class Int8Codec:
+    """Per-dimension affine scalar quantization to int8: 132 bytes per encoding.
+
+    x ~ offset + scale * (code + 128), so for a query y with
+    u = (y - offset) / scale - 128 the distance is
+    sum(scale^2 * (u - code)^2), expanded so the int8 codes only take part
+    in one matrix product and a precomputed per-vector term.
+    """
+
+    name = "int8"
+    # Per-dimension min/max from fewer rows clamps the identities added later
+    min_rows = 256
+    adaptive = True
+
+    def __init__(self):
+        self.offset = np.full(ENCODING_SIZE, -0.5)
+        self.scale = np.full(ENCODING_SIZE, 1.0 / 255)
+
+    def fit(self, encodings):
+        if len(encodings):
+            low, high = encodings.min(axis=0), encodings.max(axis=0)
+            self.offset = low
+            self.scale = np.maximum((high - low) / 255, 1e-8)
+
+    def encode(self, encodings):
+        levels = np.rint((encodings - self.offset) / self.scale) - 128
+        codes = np.clip(levels, -128, 127).astype(np.int8)
+        weights = (self.scale ** 2).astype(np.float32)
+        as_float = codes.astype(np.float32)
+        return codes, (as_float * as_float) @ weights
+
+    def decode(self, store):
+        return self.offset + self.scale * (store[0].astype(np.float64) + 128)
+
+    def concat(self, store, more):
+        return np.vstack([store[0], more[0]]), np.concatenate([store[1], more[1]])
+
+    def take(self, store, rows):
+        return store[0][rows], store[1][rows]
+
+    def squared_distances(self, store, queries):
+        codes, norms = store
+        weights = (self.scale ** 2).astype(np.float32)
+        u = ((queries - self.offset) / self.scale - 128).astype(np.float32)
+        cross = _chunked_cross(codes, (u * weights).T).T
+        squared = ((u * u) @ weights)[:, None] + norms[None, :] - 2 * cross
+        return np.maximum(squared, 0)
+
+    def nbytes(self, store):
+        return store[0].nbytes + store[1].nbytes
+
+
+class PQCodec:
+    """Product quantization: 16 sub-vectors of 8 dims, one uint8 centroid id each.
+
+    16 bytes per encoding. Distances use asymmetric lookup tables: the
+    query is kept exact and compared against every centroid once, then
+    each gallery entry's distance is the sum of 16 table lookups.
+    """
+
+    name = "pq"
+    adaptive = True
+
+    def __init__(self, subspaces=16, centroids=256, iterations=20, seed=0):
+        self.subspaces = subspaces
+        self.sub_dim = ENCODING_SIZE // subspaces
+        self.centroids = centroids
+        self.iterations = iterations
+        self.seed = seed
+        # Enough rows that every centroid of every sub-codebook is trained on several points
+        self.min_rows = 4 * centroids
+        self.codebooks = None
+
+    def fit(self, encodings):
+        if not len(encodings):
+            return
+        rng = np.random.default_rng(self.seed)
+        k = min(self.centroids, len(encodings))
+        self.codebooks = np.stack([
+            self._kmeans(encodings[:, s * self.sub_dim:(s + 1) * self.sub_dim], k, rng)
+            for s in range(self.subspaces)
+        ])
+
+    def _kmeans(self, points, k, rng):
+        centers = points[rng.choice(len(points), k, replace=False)].copy()
+        for _ in range(self.iterations):
+            assign = self._nearest(points, centers)
+            sums = np.zeros_like(centers)
+            np.add.at(sums, assign, points)
+            counts = np.bincount(assign, minlength=k)
+            filled = counts > 0
+            centers[filled] = sums[filled] / counts[filled, None]
+        return centers
+
+    @staticmethod
+    def _nearest(points, centers):
+        squared = (
+            np.einsum("ij,ij->i", centers, centers)[None, :]
+            - 2 * points @ centers.T
+        )
+        return squared.argmin(axis=1)
+
+    def _split(self, encodings):
+        return encodings.reshape(len(encodings), self.subspaces, self.sub_dim)
+
+    def encode(self, encodings):
+        parts = self._split(encodings)
+        codes = np.empty((len(encodings), self.subspaces), dtype=np.uint8)
+        for s in range(self.subspaces):
+            codes[:, s] = self._nearest(parts[:, s], self.codebooks[s])
+        return codes
+
+    def decode(self, store):
+        parts = [self.codebooks[s][store[:, s]] for s in range(self.subspaces)]
+        return np.concatenate(parts, axis=1)
+
+    def concat(self, store, more):
+        return np.vstack([store, more])
+
+    def take(self, store, rows):
+        return store[rows]
+
+    def squared_distances(self, store, queries):
+        parts = self._split(queries)
+        rows = np.arange(self.subspaces)
+        out = np.empty((len(queries), len(store)), dtype=np.float32)
+        for i, query in enumerate(parts):
+            # (subspaces, centroids) table of squared distances to every centroid
+            tables = ((self.codebooks - query[:, None, :]) ** 2).sum(axis=2).astype(np.float32)
+            out[i] = tables[rows, store].sum(axis=1)
+        return out
+
+    def nbytes(self, store):
+        return store.nbytes + (self.codebooks.nbytes if self.codebooks is not None else 0)
+
+
+CODECS = {
+    "float16": Float16Codec,
+    "int8": Int8Codec,
+    "pq": PQCodec,
+}
+
+
+class CompactGallery(Gallery):
+    """Gallery kept in a compressed form and matched without decompressing it.
+
+    The store is (codec, codes, tail): codes from a codec trained on the
+    gallery, followed by a float64 tail of rows that are not encoded yet and
+    are matched exactly. Nothing is encoded until the gallery holds the
+    codec's min_rows, so a gallery that starts small or empty is not trained
+    on its first few encodings. Once the tail reaches REFIT_GROWTH of the
+    coded rows, a new codec is trained on the decoded codes plus the tail and
+    everything is re-encoded, so identities ingested one at a time neither
+    collapse onto one PQ code nor get clamped by an int8 range fitted before
+    they existed. Codecs that learn nothing from the data encode new rows
+    straight away.
+
+    The float64 originals of add()ed rows are also held back so save() can
+    append them to encodings.pkl at full precision.
+    """
+
+    def __init__(self, encodings=None, names=None, hashes=None, mode="int8"):
+        self._codec_class = CODECS[mode]
+        self._pending = ([], [])
+        super().__init__(encodings, names, hashes)
+
+    @classmethod
+    def load(cls, path, mode="int8"):
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        return cls(data["encodings"], data["names"], data.get("hashes"), mode=mode)
+
+    @classmethod
+    def from_gallery(cls, gallery, mode="int8"):
+        return cls(gallery.encodings, gallery.names, gallery.hashes, mode=mode)
+
+    @property
+    def mode(self):
+        return self._codec_class.name
+
+    @property
+    def codec(self):
+        """The codec of the current snapshot, None while every row is still in the float64 tail."""
+        return self._snapshot[0][0]
+
+    @property
+    def encodings(self):
+        # Only an approximation of the originals for the coded rows
+        codec, codes, tail = self._snapshot[0]
+        if codec is None:
+            return tail
+        return np.vstack([codec.decode(codes), tail])
+
+    def memory_bytes(self):
+        codec, codes, tail = self._snapshot[0]
+        return (codec.nbytes(codes) if codec is not None else 0) + tail.nbytes
+
+    def _encode(self, encodings):
+        """Store for `encodings`: codes from a codec trained on them, or all float64 below min_rows."""
+        codec = self._codec_class()
+        if len(encodings) < codec.min_rows:
+            return None, None, encodings
+        codec.fit(encodings)
+        return codec, codec.encode(encodings), encodings[:0]
+
+    def _squared_distances(self, store, queries):
+        codec, codes, tail = store
+        parts = []
+        if codec is not None:
+            parts.append(codec.squared_distances(codes, queries))
+        if len(tail):
+            parts.append(super()._squared_distances(tail, queries))
+        return np.hstack(parts)
+
+    def add(self, encodings, names, digest=None):
+        encodings = as_matrix(encodings)
+        # Only writers take the lock, so a retrain here never holds up matching
+        with self.lock:
+            (codec, codes, tail), current_names = self._snapshot
+            coded = len(current_names) - len(tail)
+            tail = np.vstack([tail, encodings])
+            if codec is None:
+                store = self._encode(tail)
+            elif not codec.adaptive:
+                store = codec, codec.concat(codes, codec.encode(tail)), tail[:0]
+            elif len(tail) >= max(1, coded * REFIT_GROWTH):
+                # The originals of the coded rows are gone, their decoded values stand in for them
+                store = self._encode(np.vstack([codec.decode(codes), tail]))
+            else:
+                store = codec, codes, tail
+            self._snapshot = (store, current_names + list(names))
+            if digest is not None:
+                self.hashes.add(digest)
+            self._pending[0].extend(encodings)
+            self._pending[1].extend(names)
+
+    def save(self, path):
+        # Append the held back originals to the file rather than writing decoded approximations
+        with self.lock:
+            pending_encodings, pending_names = self._pending
+            self._pending = ([], [])
+        data = {"encodings": [], "names": []}
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+        data["encodings"] = list(data["encodings"]) + pending_encodings
+        data["names"] = list(data["names"]) + pending_names
+        data["hashes"] = sorted(self.hashes)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def partition(self, shard, shards):
+        """Return a CompactGallery with only `shard`'s identities, sharing this gallery's codec."""
+        (codec, codes, tail), names = self._snapshot
+        keep = np.array([i for i, name in enumerate(names) if shard_for(name, shards) == shard], dtype=np.intp)
+        coded = len(names) - len(tail)
+        part = CompactGallery(mode=self.mode)
+        # The codes are kept as they are, no refit and no second round of quantization error
+        part_codes = codec.take(codes, keep[keep < coded]) if codec is not None else None
+        part._snapshot = ((codec, part_codes, tail[keep[keep >= coded] - coded]), [names[i] for i in keep])
+        return part
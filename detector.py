@@ -1,12 +1,138 @@
 # app/detector.py
+import os
+
 import cv2
 import face_recognition
 
-def detect_faces(frame):
-    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    boxes = face_recognition.face_locations(rgb)
-    encodings = face_recognition.face_encodings(rgb, boxes)
-    return boxes, encodings
+from batch_encoder import BatchEncoder
+
+# Reused across calls so the descriptor output buffer is allocated once per process
+_encoder = BatchEncoder()
+
+class HogDetector:
+    """Single stage: dlib's HOG detector over the whole frame."""
+
+    name = "hog"
+
+    def locate(self, rgb, scale=1.0):
+        if scale == 1.0:
+            return face_recognition.face_locations(rgb)
+        # Detect on a downscaled copy and map boxes back to frame coordinates
+        small = cv2.resize(rgb, (0, 0), fx=scale, fy=scale)
+        return [
+            (int(top / scale), int(right / scale), int(bottom / scale), int(left / scale))
+            for (top, right, bottom, left) in face_recognition.face_locations(small)
+        ]
+
+class CascadeDetector:
+    """Two stages: a Haar cascade on a small grayscale copy proposes regions,
+    then HOG only runs on padded crops of them.
+
+    The Haar pass costs a few milliseconds at proposal_width and is tuned to
+    over-propose (low min_neighbors); HOG rejects its false positives, so the
+    frame's final boxes keep HOG's geometry. Frames with no proposals skip
+    HOG entirely. Faces the cascade misses, mostly strong profiles, are
+    missed by the cascade mode too.
+    """
+
+    name = "cascade"
+
+    def __init__(self, proposal_width=320, padding=0.6, min_neighbors=3, min_size=16):
+        self.proposal_width = proposal_width
+        self.padding = padding
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+        self.hog = HogDetector()
+        self.classifier = cv2.CascadeClassifier(
+            os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
+        )
+        if self.classifier.empty():
+            raise RuntimeError("Could not load the OpenCV frontal face Haar cascade")
+
+    def propose(self, rgb):
+        """Padded candidate regions as (top, right, bottom, left) in frame coordinates."""
+        height, width = rgb.shape[:2]
+        ratio = min(1.0, self.proposal_width / width)
+        gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+        if ratio < 1.0:
+            gray = cv2.resize(gray, (0, 0), fx=ratio, fy=ratio, interpolation=cv2.INTER_AREA)
+        gray = cv2.equalizeHist(gray)
+        found = self.classifier.detectMultiScale(
+            gray, scaleFactor=1.1, minNeighbors=self.min_neighbors, minSize=(self.min_size, self.min_size)
+        )
+
+        regions = []
+        for (x, y, w, h) in found:
+            pad = self.padding * max(w, h)
+            regions.append((
+                max(0, int((y - pad) / ratio)),
+                min(width, int((x + w + pad) / ratio)),
+                min(height, int((y + h + pad) / ratio)),
+                max(0, int((x - pad) / ratio))
+            ))
+        return _merge_regions(regions)
+
+    def locate(self, rgb, scale=1.0):
+        boxes = []
+        for (top, right, bottom, left) in self.propose(rgb):
+            crop = rgb[top:bottom, left:right]
+            boxes.extend(
+                (t + top, r + left, b + top, l + left)
+                for (t, r, b, l) in self.hog.locate(crop, scale=scale)
+            )
+        return boxes
+
+def _overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[3] < b[1] and b[3] < a[1]
+
+def _merge_regions(regions):
+    # Union overlapping crops so HOG never scans the same pixels twice or reports a face twice
+    merged = []
+    for region in regions:
+        overlapping = [other for other in merged if _overlaps(region, other)]
+        while overlapping:
+            for other in overlapping:
+                merged.remove(other)
+                region = (min(region[0], other[0]), max(region[1], other[1]),
+                          max(region[2], other[2]), min(region[3], other[3]))
+            # The grown region may now reach regions it did not touch before
+            overlapping = [other for other in merged if _overlaps(region, other)]
+        merged.append(region)
+    return merged
+
+DETECTORS = {
+    "hog": HogDetector,
+    "cascade": CascadeDetector,
+}
+
+def make_detector(name):
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown detector backend {name!r}, expected one of: {', '.join(DETECTORS)}")
+    return DETECTORS[name]()
+
+# Chosen once per process; detection workers read the same environment
+_detector = make_detector(os.environ.get("RECOGNITION_DETECTOR", "hog"))
+
+def locate_faces(rgb, scale=1.0, max_faces=None, detector=None):
+    boxes = (detector or _detector).locate(rgb, scale=scale)
+    if max_faces is not None and len(boxes) > max_faces:
+        # Keep the largest faces, they are the closest and most reliable to encode
+        boxes = sorted(boxes, key=lambda b: (b[2] - b[0]) * (b[1] - b[3]), reverse=True)[:max_faces]
+    return boxes
+
+def detect_faces_batch(frames, scale=1.0, max_faces=None, detector=None):
+    # Locate faces in every frame, then encode all of them in one batched call
+    located = []
+    for frame in frames:
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        boxes = locate_faces(rgb, scale=scale, max_faces=max_faces, detector=detector)
+        _encoder.add(rgb, boxes)
+        located.append(boxes)
+    encoded = _encoder.flush()
+    return [(boxes, list(encodings.copy())) for boxes, encodings in zip(located, encoded)]
+
+def detect_faces(frame, scale=1.0, max_faces=None, detector=None):
+    return detect_faces_batch([frame], scale=scale, max_faces=max_faces, detector=detector)[0]
 
 def draw_boxes(frame, boxes, names=None):
     for i, (top, right, bottom, left) in enumerate(boxes):
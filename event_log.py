@@ -0,0 +1,146 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from prometheus_client import Counter
+
+# Prometheus metrics
+events_written = Counter('recognition_events_written_total', 'Structured events written', ['event'])
+events_dropped = Counter('recognition_events_dropped_total', 'Structured events dropped because the queue was full')
+events_suppressed = Counter('recognition_events_suppressed_total', 'Repeated events folded by rate limiting')
+
+_STOP = object()
+
+
+class EventLogger:
+    """Queue-backed JSON-lines event log for the recognition hot path.
+
+    emit() only builds a small dict and does a non-blocking put; JSON
+    encoding, timestamp formatting and file writes happen on a background
+    thread that flushes in batches. Each line is a flat JSON object with
+    @timestamp, service, event and level keys, ready for Filebeat's ndjson
+    parser. When the queue is full events are dropped and counted rather
+    than stalling the caller. The queue is drained at interpreter exit, so
+    a normal shutdown doesn't lose the last flush interval of events.
+    """
+
+    def __init__(self, path=None, service="recognition", max_queue=10000, batch_size=500,
+                 flush_interval=0.5, rate_limit_window=10.0, max_bytes=50 * 1024 * 1024):
+        self.path = path
+        self.service = service
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rate_limit_window = rate_limit_window
+        self.max_bytes = max_bytes
+        self.queue = queue.Queue(maxsize=max_queue)
+        # rate_key -> [window start, events folded since]
+        self._windows = {}
+        self._stream = self._open()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _open(self):
+        if self.path is None:
+            return sys.stdout
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            return open(self.path, "a")
+        except OSError as e:
+            logging.warning(f"Cannot open event log {self.path} ({e}), writing events to stdout")
+            self.path = None
+            return sys.stdout
+
+    def emit(self, event, level="info", rate_key=None, **fields):
+        """Queue one event; with rate_key, repeats inside the window are folded into a count."""
+        now = time.time()
+        if rate_key is not None:
+            window = self._windows.get(rate_key)
+            if window is not None and now - window[0] < self.rate_limit_window:
+                window[1] += 1
+                events_suppressed.inc()
+                return
+            if window is not None and window[1]:
+                fields["suppressed"] = window[1]
+            if len(self._windows) > 1000:
+                # Bound the table when keys keep changing, e.g. messages with ids in them
+                self._windows.clear()
+            self._windows[rate_key] = [now, 0]
+
+        fields["event"] = event
+        fields["level"] = level
+        fields["_ts"] = now
+        try:
+            self.queue.put_nowait(fields)
+        except queue.Full:
+            events_dropped.inc()
+
+    def sighting(self, name, box, **fields):
+        top, right, bottom, left = box
+        self.emit("sighting", name=name, box={"top": top, "right": right, "bottom": bottom, "left": left}, **fields)
+
+    def timing(self, stages_ms, **fields):
+        self.emit("timing", stages_ms={stage: round(ms, 3) for stage, ms in stages_ms.items()}, **fields)
+
+    def error(self, message, **fields):
+        # Identical messages from a failing dependency would otherwise flood the log every frame
+        self.emit("error", level="error", rate_key=message, message=message, **fields)
+
+    def close(self, timeout=5.0):
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        self.queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _format(self, fields):
+        ts = fields.pop("_ts")
+        fields["@timestamp"] = datetime.fromtimestamp(ts, timezone.utc).isoformat(timespec="milliseconds")
+        fields["service"] = self.service
+        return json.dumps(fields, default=str)
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1] is not _STOP and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            stop = batch[-1] is _STOP
+            if stop:
+                batch.pop()
+            try:
+                if batch:
+                    self._stream.write("".join(self._format(fields) + "\n" for fields in batch))
+                    self._stream.flush()
+                    for fields in batch:
+                        events_written.labels(event=fields["event"]).inc()
+                    self._rotate()
+            except Exception as e:
+                logging.error(f"Failed to write {len(batch)} events: {e}")
+            if stop:
+                if self._stream is not sys.stdout:
+                    self._stream.close()
+                return
+
+    def _rotate(self):
+        # Keep one previous file; Filebeat follows the rename by inode
+        if self.path is None or self._stream.tell() < self.max_bytes:
+            return
+        self._stream.close()
+        os.replace(self.path, self.path + ".1")
+        self._stream = open(self.path, "a")
@@ -0,0 +1,269 @@
+import argparse
+import base64
+import io
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import tarfile
+import time
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='[%(asctime)s] %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+def iter_chunks(conn, after_id=0, names=None, since=None, until=None, chunk_size=200):
+    """Yield lists of (id, name, timestamp, frame) rows in id order, chunk_size at a time.
+
+    Each chunk is its own short keyset query, so at most one chunk of blobs
+    is in memory and no read transaction stays open against the recognizer.
+    """
+    clauses = ["id > ?"]
+    filters = []
+    if names:
+        clauses.append(f"name IN ({', '.join('?' for _ in names)})")
+        filters.extend(names)
+    if since:
+        clauses.append("timestamp >= ?")
+        filters.append(since)
+    if until:
+        clauses.append("timestamp <= ?")
+        filters.append(until)
+    query = (
+        f"SELECT id, name, timestamp, frame FROM face_log WHERE {' AND '.join(clauses)} "
+        f"ORDER BY id LIMIT ?"
+    )
+
+    last_id = after_id
+    while True:
+        rows = conn.execute(query, [last_id] + filters + [chunk_size]).fetchall()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+def safe_name(name):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', name)
+
+
+def truncate_to(path, offset):
+    # Drop whatever a killed run wrote after its last checkpoint
+    if offset is not None and os.path.exists(path) and os.path.getsize(path) > offset:
+        logging.info(f"Truncating {path} to the checkpointed {offset} bytes")
+        os.truncate(path, offset)
+
+
+class DirectoryWriter:
+    """Writes images/<id>_<name>.png plus a manifest.jsonl line per record."""
+
+    def __init__(self, out_dir, resume=False, resume_offset=None):
+        self.out_dir = out_dir
+        os.makedirs(os.path.join(out_dir, "images"), exist_ok=True)
+        manifest_path = os.path.join(out_dir, "manifest.jsonl")
+        # Images are named by id and simply rewritten; only the manifest needs cutting back
+        if resume:
+            truncate_to(manifest_path, resume_offset)
+        self.manifest = open(manifest_path, "a")
+
+    def write(self, id, name, timestamp, frame):
+        rel_path = os.path.join("images", f"{id}_{safe_name(name)}.png")
+        with open(os.path.join(self.out_dir, rel_path), "wb") as f:
+            f.write(frame)
+        self.manifest.write(json.dumps({
+            "id": id, "name": name, "timestamp": timestamp, "file": rel_path, "bytes": len(frame)
+        }) + "\n")
+
+    def flush(self):
+        self.manifest.flush()
+        os.fsync(self.manifest.fileno())
+
+    def offset(self):
+        return self.manifest.tell()
+
+    def close(self):
+        self.manifest.close()
+
+
+class TarWriter:
+    """Writes <id>.png and <id>.json members to a tar file or a stream.
+
+    A killed export leaves no end-of-archive block and maybe a partial
+    member, so tarfile's append mode can't reopen it. Instead the file is
+    cut back to the member boundary recorded in the checkpoint and a new
+    writer continues from there; close() writes the end-of-archive block.
+    """
+
+    def __init__(self, out, resume=False, resume_offset=None):
+        self.file = None
+        if out == "-":
+            self.tar = tarfile.open(fileobj=sys.stdout.buffer, mode="w|")
+            return
+        if resume and resume_offset is None and os.path.exists(out):
+            # Checkpoint from before offsets were recorded, only a cleanly closed tar can be appended to
+            self.tar = tarfile.open(out, mode="a")
+            self.file = self.tar.fileobj
+            return
+        if resume and os.path.exists(out):
+            truncate_to(out, resume_offset)
+            self.file = open(out, "r+b")
+            self.file.seek(resume_offset)
+        else:
+            self.file = open(out, "wb")
+        # TarFile starts writing at the file object's current position
+        self.tar = tarfile.open(fileobj=self.file, mode="w")
+
+    def _add(self, member_name, data, mtime):
+        info = tarfile.TarInfo(member_name)
+        info.size = len(data)
+        info.mtime = mtime
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def write(self, id, name, timestamp, frame):
+        mtime = time.time()
+        self._add(f"{id}.png", frame, mtime)
+        meta = json.dumps({"id": id, "name": name, "timestamp": timestamp, "file": f"{id}.png"})
+        self._add(f"{id}.json", meta.encode("utf-8"), mtime)
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def offset(self):
+        return self.tar.offset if self.file is not None else None
+
+    def close(self):
+        self.tar.close()
+        if self.file is not None:
+            self.file.close()
+
+
+class JsonlWriter:
+    """Writes one JSON object per record with the frame base64-encoded."""
+
+    def __init__(self, out, resume=False, resume_offset=None):
+        if out == "-":
+            self.stream = sys.stdout
+        elif resume:
+            truncate_to(out, resume_offset)
+            self.stream = open(out, "a")
+        else:
+            self.stream = open(out, "w")
+
+    def write(self, id, name, timestamp, frame):
+        self.stream.write(json.dumps({
+            "id": id, "name": name, "timestamp": timestamp,
+            "frame": base64.b64encode(frame).decode("ascii")
+        }) + "\n")
+
+    def flush(self):
+        self.stream.flush()
+        if self.stream is not sys.stdout:
+            os.fsync(self.stream.fileno())
+
+    def offset(self):
+        return None if self.stream is sys.stdout else self.stream.tell()
+
+    def close(self):
+        if self.stream is not sys.stdout:
+            self.stream.close()
+
+
+def load_checkpoint(path):
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {"last_id": 0, "exported": 0, "offset": None}
+
+def save_checkpoint(path, checkpoint):
+    # Write-then-rename so a crash never leaves a half-written checkpoint
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+def export(db_path, out, fmt, names=None, since=None, until=None, chunk_size=200, checkpoint_path=None):
+    checkpoint = load_checkpoint(checkpoint_path)
+    # A resumed export must select the same rows, or the output mixes two filter sets
+    selection = {"format": fmt, "names": sorted(names) if names else None, "since": since, "until": until}
+    if checkpoint["last_id"] > 0:
+        if "selection" not in checkpoint:
+            logging.warning(f"Checkpoint {checkpoint_path} does not record its filters, assuming they are unchanged")
+        elif checkpoint["selection"] != selection:
+            raise ValueError(
+                f"Checkpoint {checkpoint_path} belongs to an export with {checkpoint['selection']}, not {selection}; "
+                f"use another output or remove the checkpoint and the output to start over"
+            )
+    checkpoint["selection"] = selection
+    # Output size at the last checkpoint; anything past it was written after and gets redone
+    resume = checkpoint["last_id"] > 0
+    resume_offset = checkpoint.get("offset")
+    if resume:
+        logging.info(f"Resuming export after id {checkpoint['last_id']} ({checkpoint['exported']} already exported)")
+
+    if fmt == "dir":
+        writer = DirectoryWriter(out, resume, resume_offset)
+    elif fmt == "tar":
+        writer = TarWriter(out, resume, resume_offset)
+    else:
+        writer = JsonlWriter(out, resume, resume_offset)
+
+    conn = sqlite3.connect(db_path)
+    start = time.perf_counter()
+    try:
+        for rows in iter_chunks(conn, checkpoint["last_id"], names, since, until, chunk_size):
+            for id, name, timestamp, frame in rows:
+                writer.write(id, name, timestamp, frame)
+            writer.flush()
+
+            checkpoint["last_id"] = rows[-1][0]
+            checkpoint["exported"] += len(rows)
+            checkpoint["offset"] = writer.offset()
+            if checkpoint_path:
+                save_checkpoint(checkpoint_path, checkpoint)
+            logging.info(f"Exported {checkpoint['exported']} records (last id {checkpoint['last_id']})")
+    finally:
+        writer.close()
+        conn.close()
+
+    logging.info(f"Export finished: {checkpoint['exported']} records in {time.perf_counter() - start:.1f}s")
+    return checkpoint["exported"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream face_log records out of the database in bounded chunks")
+    parser.add_argument("out", help="Output directory (dir), file or '-' for stdout (tar, jsonl)")
+    parser.add_argument("--db", default="/app/db/face_log.db")
+    parser.add_argument("--format", choices=["dir", "tar", "jsonl"], default="dir")
+    parser.add_argument("--name", action="append", help="Only export this identity (repeatable)")
+    parser.add_argument("--since", help="Earliest timestamp, e.g. '2025-01-31 00:00:00'")
+    parser.add_argument("--until", help="Latest timestamp, e.g. '2025-01-31 23:59:59'")
+    parser.add_argument("--chunk-size", type=int, default=200)
+    parser.add_argument("--checkpoint", help="Checkpoint file for resuming (default: next to the output)")
+    args = parser.parse_args()
+
+    checkpoint_path = args.checkpoint
+    if checkpoint_path is None and args.out != "-":
+        checkpoint_path = (
+            os.path.join(args.out, ".export-checkpoint.json") if args.format == "dir"
+            else args.out + ".checkpoint.json"
+        )
+    if args.format == "dir" and args.out == "-":
+        parser.error("dir format needs an output directory")
+
+    try:
+        export(args.db, args.out, args.format, args.name, args.since, args.until,
+               args.chunk_size, checkpoint_path)
+    except sqlite3.Error as e:
+        logging.error(f"Database error: {e}")
+        sys.exit(1)
+    except ValueError as e:
+        logging.error(str(e))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
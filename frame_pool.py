@@ -0,0 +1,169 @@
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from detector import detect_faces_batch
+
+# Per-process view of the shared frame ring the last task used, as (name, shm, frames)
+_worker_ring = None
+
+
+class SharedFrameRing:
+    """Fixed number of frame-sized slots in one shared memory block.
+
+    Frames are copied into a free slot once by the capture side; worker
+    processes map the same block and read the slot in place, so only the
+    slot index crosses the process boundary.
+    """
+
+    def __init__(self, slots, frame_shape):
+        self.slots = slots
+        self.frame_shape = tuple(frame_shape)
+        size = int(np.prod(self.frame_shape)) * slots
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.frames = np.ndarray((slots,) + self.frame_shape, dtype=np.uint8, buffer=self.shm.buf)
+        self.free = deque(range(slots))
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def put(self, frame):
+        if frame.shape != self.frame_shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match ring shape {self.frame_shape}")
+        if not self.free:
+            raise RuntimeError("No free slot in frame ring")
+        slot = self.free.popleft()
+        np.copyto(self.frames[slot], frame)
+        return slot
+
+    def release(self, slot):
+        self.free.append(slot)
+
+    def close(self):
+        # Drop the numpy view before closing, the buffer can't be released while exported
+        self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # A caller still holds a frame view; the mapping goes away with it
+            pass
+        self.shm.unlink()
+
+
+def detection_executor(workers):
+    """Process pool for detection that is safe to create from a multithreaded process.
+
+    Workers are forked from a single-threaded forkserver that has already
+    imported the detector and its models, so they start quickly and never
+    inherit locks held by the caller's threads (HTTP server, event log
+    writer, BLAS). Create it once and reuse it across DetectionPools.
+    """
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(["detector"])
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+def _ring_frames(name, slots, frame_shape):
+    # Attach on first use; a long-lived worker serves one ring per recognition run
+    global _worker_ring
+    if _worker_ring is None or _worker_ring[0] != name:
+        if _worker_ring is not None:
+            _, shm, _ = _worker_ring
+            _worker_ring = None
+            shm.close()
+        shm = shared_memory.SharedMemory(name=name)
+        frames = np.ndarray((slots,) + tuple(frame_shape), dtype=np.uint8, buffer=shm.buf)
+        _worker_ring = (name, shm, frames)
+    return _worker_ring[2]
+
+def _detect_slots(ring, slots, scale, max_faces):
+    frames = _ring_frames(*ring)
+    # All faces of the grouped frames go through the encoder in one batch
+    return detect_faces_batch([frames[slot] for slot in slots], scale=scale, max_faces=max_faces)
+
+
+class DetectionPool:
+    """Runs detection in worker processes over frames in a SharedFrameRing.
+
+    submit() places a frame in the ring and queues detection on its slot;
+    next_result() returns results strictly in submission order. With
+    batch_frames > 1, consecutive frames are grouped into one task so their
+    faces are encoded in a single batched call. The frame returned by
+    next_result() is a view into the ring and stays valid until the
+    following call. Pass a long-lived executor from detection_executor() to
+    reuse its worker processes; otherwise the pool starts and stops its own.
+    """
+
+    def __init__(self, workers, frame_shape, depth=None, batch_frames=1, executor=None):
+        self.workers = workers
+        self.batch_frames = batch_frames
+        # Keep every worker busy with one batch queued behind the one it is processing
+        self.depth = depth or workers * batch_frames * 2
+        # One extra slot for the frame the consumer is still holding
+        self.ring = SharedFrameRing(self.depth + 1, frame_shape)
+        self.owns_executor = executor is None
+        self.executor = executor if executor is not None else detection_executor(workers)
+        # Entries are [slot, future, index of the frame within its batch]
+        self.pending = deque()
+        self._batch = []
+        self._batch_params = (1.0, None)
+        self._held = None
+        logging.info(f"Detection pool started with {workers} workers and {self.ring.slots} frame slots")
+
+    @property
+    def full(self):
+        return len(self.pending) >= self.depth
+
+    def submit(self, frame, scale=1.0, max_faces=None, detect=True):
+        slot = self.ring.put(frame)
+        if not detect:
+            # Frames skipped by load shedding still travel through the queue to keep order
+            self.pending.append([slot, None, None])
+            return
+        entry = [slot, None, len(self._batch)]
+        self._batch.append(entry)
+        self._batch_params = (scale, max_faces)
+        self.pending.append(entry)
+        if len(self._batch) >= self.batch_frames:
+            self._submit_batch()
+
+    def _submit_batch(self):
+        slots = tuple(entry[0] for entry in self._batch)
+        ring = (self.ring.name, self.ring.slots, self.ring.frame_shape)
+        future = self.executor.submit(_detect_slots, ring, slots, *self._batch_params)
+        for entry in self._batch:
+            entry[1] = future
+        self._batch = []
+
+    def next_result(self):
+        """Return (frame, boxes, encodings) for the oldest frame, boxes is None if it wasn't detected."""
+        if self._held is not None:
+            self.ring.release(self._held)
+            self._held = None
+        entry = self.pending.popleft()
+        slot, _, index = entry
+        self._held = slot
+        if index is None:
+            return self.ring.frames[slot], None, None
+        if entry[1] is None:
+            # The oldest frame sits in a partial batch, send it off as is
+            self._submit_batch()
+        boxes, encodings = entry[1].result()[index]
+        return self.ring.frames[slot], boxes, encodings
+
+    def close(self):
+        futures = {future for _, future, _ in self.pending if future is not None}
+        for future in futures:
+            future.cancel()
+        if self.owns_executor:
+            self.executor.shutdown(wait=True)
+        else:
+            # Tasks already running still read the ring; let them finish before it goes away
+            wait(futures)
+        self.pending.clear()
+        self._batch = []
+        self.ring.close()
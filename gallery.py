@@ -0,0 +1,125 @@
+import os
+import pickle
+import threading
+import zlib
+
+import numpy as np
+
+ENCODING_SIZE = 128
+
+
+def shard_for(name, shards):
+    # Stable across processes and restarts, unlike hash()
+    return zlib.crc32(name.encode("utf-8")) % shards
+
+
+def as_matrix(encodings):
+    encodings = np.asarray(encodings if encodings is not None else [], dtype=np.float64)
+    return encodings.reshape(-1, ENCODING_SIZE)
+
+
+class Gallery:
+    """Known face encodings, their labels and the content hashes they came from.
+
+    Encodings live in one (n, 128) array so matching is a single vectorized
+    distance computation. add() swaps in a new (store, names) snapshot
+    under a lock, so the recognition loop can keep matching against the old
+    snapshot while new identities are ingested. Subclasses change how the
+    store is laid out by overriding the _encode/_concat/_squared_distances
+    hooks.
+    """
+
+    def __init__(self, encodings=None, names=None, hashes=None):
+        self.lock = threading.Lock()
+        self._snapshot = (self._encode(as_matrix(encodings)), list(names or []))
+        self.hashes = set(hashes or [])
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        return cls(data["encodings"], data["names"], data.get("hashes"))
+
+    def save(self, path):
+        encodings, names = self._snapshot
+        # Same layout train_service.py writes, plus the hashes used for dedupe
+        data = {"encodings": list(encodings), "names": names, "hashes": sorted(self.hashes)}
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        return len(self._snapshot[1])
+
+    @property
+    def encodings(self):
+        return self._snapshot[0]
+
+    @property
+    def names(self):
+        return self._snapshot[1]
+
+    def memory_bytes(self):
+        return self._snapshot[0].nbytes
+
+    def has_hash(self, digest):
+        return digest in self.hashes
+
+    # Storage hooks
+    def _encode(self, encodings):
+        return encodings
+
+    def _concat(self, store, more):
+        return np.vstack([store, more])
+
+    def _squared_distances(self, store, queries):
+        # |q - e|^2 = |q|^2 + |e|^2 - 2 q.e, one matrix product for the whole batch
+        squared = (
+            np.einsum("ij,ij->i", queries, queries)[:, None]
+            + np.einsum("ij,ij->i", store, store)[None, :]
+            - 2 * queries @ store.T
+        )
+        return np.maximum(squared, 0)
+
+    def add(self, encodings, names, digest=None):
+        encoded = self._encode(as_matrix(encodings))
+        with self.lock:
+            store, current_names = self._snapshot
+            self._snapshot = (self._concat(store, encoded), current_names + list(names))
+            if digest is not None:
+                self.hashes.add(digest)
+
+    def match(self, encoding, tolerance=0.5):
+        """Return the label of the first known encoding within tolerance, like compare_faces()."""
+        store, names = self._snapshot
+        if not len(names):
+            return None
+        squared = self._squared_distances(store, as_matrix(encoding))[0]
+        hits = np.flatnonzero(squared <= tolerance ** 2)
+        return names[hits[0]] if len(hits) else None
+
+    def match_batch(self, encodings, tolerance=0.5):
+        return [self.match(encoding, tolerance) for encoding in encodings]
+
+    def topk(self, queries, k=1):
+        """Return the k nearest (distance, label) pairs for every query, nearest first."""
+        store, names = self._snapshot
+        queries = as_matrix(queries)
+        if not len(names):
+            return [[] for _ in range(len(queries))]
+
+        distances = np.sqrt(self._squared_distances(store, queries))
+        k = min(k, len(names))
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in zip(distances, nearest):
+            ordered = candidates[np.argsort(row[candidates])]
+            results.append([(float(row[j]), names[j]) for j in ordered])
+        return results
+
+    def partition(self, shard, shards):
+        """Return a Gallery holding only the identities that belong to `shard`."""
+        encodings, names = self._snapshot
+        keep = [i for i, name in enumerate(names) if shard_for(name, shards) == shard]
+        return Gallery(encodings[keep], [names[i] for i in keep])
@@ -0,0 +1,193 @@
+import argparse
+import hashlib
+import io
+import logging
+import os
+import queue
+import re
+import sys
+import tarfile
+import threading
+import urllib.request
+import zipfile
+
+from prometheus_client import Counter
+
+# Prometheus metrics
+ingested_images = Counter('ingest_images_total', 'Images received through archive ingestion', ['result'])
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def label_from_path(member_path):
+    # Same convention as train_service.py: the person directory starts with the numeric label
+    parts = member_path.replace("\\", "/").split("/")
+    for dirname in reversed(parts[:-1]):
+        match = re.match(r'^(\d+)', dirname)
+        if match:
+            return match.group(1)
+    return None
+
+def iter_archive_images(fileobj, filename=""):
+    """Yield (member_path, image_bytes) from a zip or tar archive without extracting it.
+
+    Tar archives are read as a stream, so fileobj may be a non-seekable
+    request body. Zip needs its central directory and therefore a seekable
+    file object, which an uploaded file already is.
+    """
+    if filename.lower().endswith(".zip"):
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                    yield info.filename, archive.read(info)
+        return
+
+    with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+        for member in archive:
+            if member.isfile() and member.name.lower().endswith(IMAGE_EXTENSIONS):
+                yield member.name, archive.extractfile(member).read()
+
+
+class IngestWorker:
+    """Encodes queued images on a background thread and adds them to a Gallery.
+
+    Images become matchable as soon as their encoding is added, and the
+    gallery is written back to disk whenever the queue drains.
+    """
+
+    def __init__(self, gallery, encodings_path=None, max_pending=256):
+        self.gallery = gallery
+        self.encodings_path = encodings_path
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.stats = {"queued": 0, "encoded": 0, "duplicate": 0, "no_face": 0, "unlabeled": 0, "failed": 0}
+        # Hashes queued but not yet in the gallery, so one upload can't queue the same image twice
+        self._in_flight = set()
+        # Concurrent uploads submit from several request threads
+        self.lock = threading.Lock()
+        self._dirty = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _count(self, result):
+        with self.lock:
+            self.stats[result] += 1
+        ingested_images.labels(result=result).inc()
+
+    def submit(self, member_path, data):
+        """Queue one image; blocks while the encoder is behind so memory stays bounded."""
+        label = label_from_path(member_path)
+        if label is None:
+            logging.warning(f"No numeric label directory for {member_path}, skipping")
+            self._count("unlabeled")
+            return False
+
+        digest = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            # Check and claim in one step so two uploads of the same image can't both queue it
+            duplicate = self.gallery.has_hash(digest) or digest in self._in_flight
+            if not duplicate:
+                self._in_flight.add(digest)
+        if duplicate:
+            self._count("duplicate")
+            return False
+
+        self.queue.put((member_path, label, data, digest))
+        self._count("queued")
+        return True
+
+    def join(self):
+        self.queue.join()
+
+    def _run(self):
+        import face_recognition
+
+        while True:
+            member_path, label, data, digest = self.queue.get()
+            try:
+                image = face_recognition.load_image_file(io.BytesIO(data))
+                encs = face_recognition.face_encodings(image)
+                if encs:
+                    self.gallery.add([encs[0]], [label], digest)
+                    self._dirty = True
+                    self._count("encoded")
+                    logging.debug(f"Encoded {member_path} as label '{label}'")
+                else:
+                    logging.warning(f"No faces found in image {member_path}")
+                    self._count("no_face")
+            except Exception as e:
+                logging.error(f"Failed to process image {member_path}: {e}")
+                self._count("failed")
+            finally:
+                with self.lock:
+                    self._in_flight.discard(digest)
+                if self.queue.empty():
+                    self._persist()
+                self.queue.task_done()
+
+    def _persist(self):
+        if not self._dirty or self.encodings_path is None:
+            return
+        try:
+            self.gallery.save(self.encodings_path)
+            self._dirty = False
+            logging.info(f"Saved {len(self.gallery)} encodings to {self.encodings_path}")
+        except Exception as e:
+            logging.error(f"Failed to save encodings: {e}")
+
+
+def ingest_archive(fileobj, filename, worker):
+    """Stream every image of an archive into the worker; returns how many were queued."""
+    queued = 0
+    for member_path, data in iter_archive_images(fileobj, filename):
+        if worker.submit(member_path, data):
+            queued += 1
+    return queued
+
+def upload(archive_path, url):
+    # Stream the archive as the request body; the worker reads tar members as they arrive
+    name = os.path.basename(archive_path)
+    with open(archive_path, "rb") as f:
+        req = urllib.request.Request(
+            url.rstrip("/") + "/ingest?wait=1",
+            data=f,
+            method="POST",
+            headers={
+                "Content-Type": "application/octet-stream",
+                "Content-Length": str(os.path.getsize(archive_path)),
+                "X-Archive-Name": name
+            }
+        )
+        with urllib.request.urlopen(req) as resp:
+            return resp.read().decode("utf-8")
+
+def main():
+    from gallery import Gallery
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='[%(asctime)s] %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    parser = argparse.ArgumentParser(description="Ingest a zip/tar of labeled face images (e.g. 1/img.jpg, 2/img.jpg)")
+    parser.add_argument("archive", help="Path to a .zip or .tar[.gz] archive")
+    parser.add_argument("--url", help="Send to a running recognition worker, e.g. http://recognition:5002")
+    parser.add_argument("--encodings", default="/app/models/encodings.pkl",
+                        help="Gallery to update when ingesting locally")
+    args = parser.parse_args()
+
+    if args.url:
+        print(upload(args.archive, args.url))
+        return
+
+    gallery = Gallery.load(args.encodings) if os.path.exists(args.encodings) else Gallery()
+    worker = IngestWorker(gallery, args.encodings)
+    with open(args.archive, "rb") as f:
+        ingest_archive(f, args.archive, worker)
+    worker.join()
+    logging.info(f"Ingestion finished: {worker.stats}")
+    if worker.stats["failed"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
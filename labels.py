@@ -0,0 +1,5 @@
+# Map the numeric folder labels used for training to display names
+LABEL_MAP = {
+    "1": "Subha",
+    "2": "Ayushi"
+}
@@ -0,0 +1,112 @@
+import logging
+
+from prometheus_client import Counter, Gauge
+
+# Prometheus metrics
+shed_level = Gauge('recognition_shed_level', 'Current load shedding level (0=full quality)')
+detect_interval_gauge = Gauge('recognition_detect_interval', 'Frames between face detections')
+detect_scale_gauge = Gauge('recognition_detect_scale', 'Scale factor applied to frames before detection')
+max_faces_gauge = Gauge('recognition_max_faces', 'Maximum faces encoded per frame (0=unlimited)')
+frame_cost_gauge = Gauge('recognition_frame_cost_ms', 'Smoothed per-frame processing cost in milliseconds')
+latency_target_gauge = Gauge('recognition_latency_target_ms', 'Configured per-frame latency target in milliseconds')
+shed_adjustments = Counter('recognition_shed_adjustments_total', 'Load shedding level changes', ['direction'])
+
+# Each level trades quality for cost: (detect_interval, detect_scale, max_faces)
+DEFAULT_LEVELS = [
+    (1, 1.0, None),
+    (1, 0.75, None),
+    (2, 0.75, 8),
+    (2, 0.5, 6),
+    (3, 0.5, 4),
+    (4, 0.5, 2),
+    (5, 0.35, 1),
+]
+
+
+class LoadShedder:
+    """Adapts detection work per frame to hold a per-frame latency target.
+
+    The recognizer reports the wall time of every frame via record(). The
+    cost is smoothed with an exponential moving average; when it stays above
+    the target for `patience` frames the controller steps to a cheaper level,
+    and when it stays below `target_ms * backoff_ratio` for `cooldown` frames
+    it steps back towards full quality.
+    """
+
+    def __init__(self, target_ms=100.0, levels=None, alpha=0.2, patience=5,
+                 cooldown=30, backoff_ratio=0.6):
+        self.target_ms = float(target_ms)
+        self.levels = levels or DEFAULT_LEVELS
+        self.alpha = alpha
+        self.patience = patience
+        self.cooldown = cooldown
+        self.backoff_ratio = backoff_ratio
+
+        self.level = 0
+        self.cost_ms = None
+        self._over = 0
+        self._under = 0
+        self._frame = 0
+
+        latency_target_gauge.set(self.target_ms)
+        self._publish()
+
+    @property
+    def detect_interval(self):
+        return self.levels[self.level][0]
+
+    @property
+    def detect_scale(self):
+        return self.levels[self.level][1]
+
+    @property
+    def max_faces(self):
+        return self.levels[self.level][2]
+
+    def should_detect(self):
+        """Return True if detection should run on the next frame."""
+        detect = self._frame % self.detect_interval == 0
+        self._frame += 1
+        return detect
+
+    def record(self, elapsed_ms):
+        """Feed the wall time of one processed frame into the controller."""
+        if self.cost_ms is None:
+            self.cost_ms = elapsed_ms
+        else:
+            self.cost_ms = self.alpha * elapsed_ms + (1 - self.alpha) * self.cost_ms
+        frame_cost_gauge.set(self.cost_ms)
+
+        if self.cost_ms > self.target_ms:
+            self._over += 1
+            self._under = 0
+        elif self.cost_ms < self.target_ms * self.backoff_ratio:
+            self._under += 1
+            self._over = 0
+        else:
+            self._over = 0
+            self._under = 0
+
+        if self._over >= self.patience and self.level < len(self.levels) - 1:
+            self._set_level(self.level + 1, "up")
+        elif self._under >= self.cooldown and self.level > 0:
+            self._set_level(self.level - 1, "down")
+
+    def _set_level(self, level, direction):
+        self.level = level
+        self._over = 0
+        self._under = 0
+        # Restart the interval so the next frame is always detected
+        self._frame = 0
+        shed_adjustments.labels(direction=direction).inc()
+        self._publish()
+        logging.info(
+            f"Load shedding {direction} to level {level}: interval={self.detect_interval}, "
+            f"scale={self.detect_scale}, max_faces={self.max_faces}, cost={self.cost_ms:.1f}ms"
+        )
+
+    def _publish(self):
+        shed_level.set(self.level)
+        detect_interval_gauge.set(self.detect_interval)
+        detect_scale_gauge.set(self.detect_scale)
+        max_faces_gauge.set(self.max_faces or 0)
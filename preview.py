@@ -0,0 +1,73 @@
+import threading
+
+import cv2
+import numpy as np
+from prometheus_client import Gauge
+
+# Prometheus metrics
+preview_viewers = Gauge('recognition_preview_viewers', 'Clients currently watching the MJPEG preview')
+
+BOUNDARY = "frame"
+MIMETYPE = f"multipart/x-mixed-replace; boundary={BOUNDARY}"
+
+
+class PreviewBuffer:
+    """Latest annotated frame, JPEG-encoded once and shared by every viewer.
+
+    The recognition loop calls publish() each frame; it returns immediately
+    when nobody is watching, so no JPEG encoding happens without viewers.
+    Each viewer waits for a newer frame than the one it last sent and always
+    takes the latest, so a slow connection skips frames instead of queueing
+    them or holding up the loop. While nothing is published a viewer resends
+    its last frame every keepalive seconds; writing is the only way to
+    notice a client that went away.
+    """
+
+    def __init__(self, quality=80):
+        self.quality = quality
+        self.cond = threading.Condition()
+        self.jpeg = None
+        self.seq = 0
+        self.viewers = 0
+        # Sent as the keep-alive before the first frame arrives
+        self.idle_jpeg = cv2.imencode('.jpg', np.zeros((240, 320, 3), np.uint8))[1].tobytes()
+
+    @property
+    def active(self):
+        return self.viewers > 0
+
+    def publish(self, frame):
+        if not self.viewers:
+            return
+        ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return
+        with self.cond:
+            self.jpeg = encoded.tobytes()
+            self.seq += 1
+            self.cond.notify_all()
+
+    def _set_viewers(self, delta):
+        with self.cond:
+            self.viewers += delta
+            preview_viewers.set(self.viewers)
+            if not self.viewers:
+                # Don't show a stale frame to the next viewer
+                self.jpeg = None
+
+    def mjpeg(self, keepalive=5.0):
+        """Yield multipart/x-mixed-replace parts for one viewer until the client goes away."""
+        self._set_viewers(1)
+        last_seq = self.seq
+        jpeg = self.idle_jpeg
+        try:
+            while True:
+                with self.cond:
+                    if self.cond.wait_for(lambda: self.seq != last_seq and self.jpeg is not None, keepalive):
+                        jpeg, last_seq = self.jpeg, self.seq
+                yield (
+                    f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n".encode("ascii")
+                    + jpeg + b"\r\n"
+                )
+        finally:
+            self._set_viewers(-1)
@@ -1,6 +1,4 @@
 import cv2
-import pickle
-import face_recognition
 import sqlite3
 from datetime import datetime,timedelta
 import os
@@ -8,19 +6,46 @@ import io
 import time
 import signal
 import sys
+import logging
+import numpy as np
+
+from prometheus_client import start_http_server
+
+from startup_profile import StartupProfile
+
+# face_recognition loads the dlib HOG detector and ResNet encoder on import,
+# so time it separately from the rest of startup
+startup = StartupProfile()
+with startup.phase("import_face_recognition"):
+    import face_recognition
 
 from detector import detect_faces, draw_boxes
+from event_log import EventLogger
+from frame_pool import DetectionPool, detection_executor
+from compact_gallery import CompactGallery
+from gallery import Gallery
+from labels import LABEL_MAP
+from shard_matcher import ShardedMatcher, parse_addresses
+from load_shedding import LoadShedder
+from preview import PreviewBuffer
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='[%(asctime)s] %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+def parse_source(value):
+    # Camera indices come in as digits, anything else is a device path or video file
+    return int(value) if str(value).isdigit() else value
 
 class FaceRecognizer:
-    def __init__(self):
-        # Map folder labels to actual names
-        self.label_map = {
-            "1": "Subha",
-            "2": "Ayushi"
-        }
+    def __init__(self, models_dir="/app/models", db_dir="/app/db", latency_target_ms=None, profile=None,
+                 detect_workers=None, batch_frames=None, event_log_path=None):
+        self.label_map = dict(LABEL_MAP)
         
-        self.models_dir = "/app/models"
-        self.db_dir = "/app/db"
+        self.models_dir = models_dir
+        self.db_dir = db_dir
         
         # Ensure directories exist
         os.makedirs(self.db_dir, exist_ok=True)
@@ -41,11 +66,50 @@ class FaceRecognizer:
         ''')
         self.conn.commit()
         
-        # Load known face encodings and labels
-        self.load_encodings()
+        # Match against remote identity shards when configured, otherwise the local gallery
+        self.profile = profile if profile is not None else startup
+        shards = os.environ.get("RECOGNITION_SHARDS")
+        if shards:
+            # The matchers hold the identities; keeping encodings.pkl here too would defeat sharding
+            self.gallery = Gallery()
+            timeout_ms = float(os.environ.get("RECOGNITION_SHARD_TIMEOUT_MS", "50"))
+            self.matcher = ShardedMatcher(parse_addresses(shards), timeout=timeout_ms / 1000)
+            print(f"[INFO] Matching against {len(self.matcher.addresses)} gallery shards, no local gallery loaded")
+        else:
+            # Load known face encodings and labels
+            with self.profile.phase("load_gallery"):
+                self.load_encodings()
+            self.matcher = self.gallery
         
         # Initialize video capture
         self.cap = None
+        self.source = None
+
+        # Sightings, stage timings and errors go to a JSON-lines file off the inference thread
+        if event_log_path is None:
+            event_log_path = os.environ.get("RECOGNITION_EVENT_LOG", "/app/logs/events/recognition.jsonl")
+        self.events = EventLogger(event_log_path)
+
+        # Annotated frames for the MJPEG preview, only encoded while someone is watching
+        self.preview = PreviewBuffer(quality=int(os.environ.get("RECOGNITION_PREVIEW_QUALITY", "80")))
+
+        # Adaptive load shedding towards a per-frame latency target (0 disables it)
+        if latency_target_ms is None:
+            latency_target_ms = float(os.environ.get("RECOGNITION_LATENCY_TARGET_MS", "150"))
+        self.shedder = LoadShedder(target_ms=latency_target_ms) if latency_target_ms > 0 else None
+        self.last_locations = []
+        self.last_names = []
+
+        # Fan detection out to a process pool over shared memory frames (0 or 1 keeps it in-process)
+        if detect_workers is None:
+            detect_workers = int(os.environ.get("RECOGNITION_DETECT_WORKERS", "0"))
+        self.detect_workers = detect_workers
+        # Pool mode only: frames grouped per worker task so their faces are encoded in one batch
+        if batch_frames is None:
+            batch_frames = int(os.environ.get("RECOGNITION_BATCH_FRAMES", "1"))
+        self.batch_frames = max(1, batch_frames)
+        # Started once in warm_up() and reused by every run
+        self.detect_executor = None
         
         # Set up signal handling for graceful exit
         signal.signal(signal.SIGINT, self.signal_handler)
@@ -56,19 +120,41 @@ class FaceRecognizer:
         if not os.path.exists(self.encodings_path):
             print(f"[ERROR] Encodings file not found at {self.encodings_path}")
             print("[INFO] Please run training first")
-            self.data = {"encodings": [], "names": []}
+            self.gallery = Gallery()
             return False
             
         try:
-            with open(self.encodings_path, "rb") as f:
-                self.data = pickle.load(f)
-            print(f"[INFO] Loaded {len(self.data['encodings'])} face encodings")
+            # float64 keeps the original arrays; float16, int8 and pq hold a compressed copy instead
+            mode = os.environ.get("RECOGNITION_GALLERY_MODE", "float64")
+            if mode == "float64":
+                self.gallery = Gallery.load(self.encodings_path)
+            else:
+                self.gallery = CompactGallery.load(self.encodings_path, mode=mode)
+            print(f"[INFO] Loaded {len(self.gallery)} face encodings ({mode}, {self.gallery.memory_bytes()} bytes)")
             return True
         except Exception as e:
             print(f"[ERROR] Failed to load encodings: {e}")
-            self.data = {"encodings": [], "names": []}
+            self.gallery = Gallery()
             return False
 
+    def warm_up(self):
+        # Run the detector and encoder once so the first real frame doesn't pay for it
+        with self.profile.phase("warm_up_models"):
+            blank = np.zeros((240, 320, 3), np.uint8)
+            detect_faces(blank)
+            face_recognition.face_encodings(blank, [(40, 190, 190, 40)])
+        if self.detect_workers > 1:
+            with self.profile.phase("start_detect_workers"):
+                self.start_detect_workers()
+
+    def start_detect_workers(self):
+        if self.detect_executor is None:
+            self.detect_executor = detection_executor(self.detect_workers)
+            # Bring every worker up now rather than on the first frames of a run
+            for future in [self.detect_executor.submit(int) for _ in range(self.detect_workers)]:
+                future.result()
+        return self.detect_executor
+
     def frame_to_bytes(self, frame):
         # Encode frame as PNG in memory and return bytes
         try:
@@ -77,7 +163,7 @@ class FaceRecognizer:
                 raise ValueError("Could not encode frame")
             return encoded_image.tobytes()
         except Exception as e:
-            print(f"[ERROR] Failed to convert frame to bytes: {e}")
+            self.events.error("Failed to convert frame to bytes", error=str(e))
             # Create a small placeholder image instead
             blank = np.zeros((100, 100, 3), np.uint8)
             success, encoded_image = cv2.imencode('.png', blank)
@@ -88,20 +174,132 @@ class FaceRecognizer:
         if self.cap is not None:
             self.cap.release()
         cv2.destroyAllWindows()
+        self.events.close()
         self.conn.close()
         sys.exit(0)
 
-    def run(self, max_frames=None):
+    def process_frame(self, frame, log_faces=True):
+        # Detect, match and log faces in one frame; returns boxes and names for drawing
+        if self.shedder is not None and not self.shedder.should_detect():
+            # Shedding load: reuse the last detections instead of running HOG again
+            return self.last_locations, self.last_names
+
+        scale, max_faces = self.detection_params()
+        start = time.perf_counter()
+        face_locations, face_encodings = detect_faces(frame, scale=scale, max_faces=max_faces)
+        detect_ms = (time.perf_counter() - start) * 1000
+        names = self.recognize_faces(frame, face_locations, face_encodings, log_faces, detect_ms=detect_ms)
+        return face_locations, names
+
+    def detection_params(self):
+        if self.shedder is None:
+            return 1.0, None
+        return self.shedder.detect_scale, self.shedder.max_faces
+
+    def recognize_faces(self, frame, face_locations, face_encodings, log_faces=True, detect_ms=None):
+        names = []
+        start = time.perf_counter()
+        raw_names = self.matcher.match_batch(face_encodings, tolerance=0.5)
+        match_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        for box, raw_name in zip(face_locations, raw_names):
+            name = "Unseen"
+            if raw_name is not None:
+                name = self.label_map.get(raw_name, raw_name)
+            self.events.sighting(name, box, source=str(self.source))
+
+            if log_faces:
+                from zoneinfo import ZoneInfo
+                timestamp = datetime.now(ZoneInfo("Asia/Kolkata")).strftime("%Y-%m-%d %H:%M:%S")
+
+                # Convert frame to bytes for BLOB storage
+                frame_bytes = self.frame_to_bytes(frame)
+
+                # Insert into DB: name, timestamp, frame blob
+                try:
+                    self.cursor.execute(
+                        'INSERT INTO face_log (name, timestamp, frame) VALUES (?, ?, ?)',
+                        (name, timestamp, frame_bytes)
+                    )
+                    self.conn.commit()
+                except Exception as e:
+                    self.events.error("Failed to insert into database", error=str(e))
+
+            names.append(name)
+
+        stages_ms = {"match": match_ms, "log": (time.perf_counter() - start) * 1000}
+        if detect_ms is not None:
+            stages_ms["detect"] = detect_ms
+        self.events.timing(stages_ms, faces=len(face_locations))
+
+        self.last_locations = face_locations
+        self.last_names = names
+        return names
+
+    def read_frames(self, stop_event=None, on_attach=None):
+        # Yield captured frames until the source runs dry or a stop is requested
+        first_frame_start = time.perf_counter()
+        first = True
+        while stop_event is None or not stop_event.is_set():
+            ret, frame = self.cap.read()
+            if not ret:
+                self.events.error("Failed to capture frame", source=str(self.source))
+                return
+            if first:
+                first = False
+                self.profile.record("first_frame", time.perf_counter() - first_frame_start)
+                self.profile.report()
+                if on_attach is not None:
+                    on_attach()
+            yield frame
+
+    def recognize_stream(self, frames):
+        # Yield (frame, face_locations, names) for each frame, in capture order
+        if self.detect_workers <= 1:
+            for frame in frames:
+                face_locations, names = self.process_frame(frame)
+                yield frame, face_locations, names
+            return
+
+        pool = None
+        try:
+            for frame in frames:
+                if pool is None:
+                    pool = DetectionPool(self.detect_workers, frame.shape, batch_frames=self.batch_frames,
+                                         executor=self.start_detect_workers())
+                detect = self.shedder is None or self.shedder.should_detect()
+                scale, max_faces = self.detection_params()
+                pool.submit(frame, scale=scale, max_faces=max_faces, detect=detect)
+                if pool.full:
+                    yield self._pool_result(pool)
+            while pool is not None and pool.pending:
+                yield self._pool_result(pool)
+        finally:
+            if pool is not None:
+                pool.close()
+
+    def _pool_result(self, pool):
+        frame, face_locations, face_encodings = pool.next_result()
+        if face_locations is None:
+            # Frame was skipped by load shedding, reuse the last detections
+            return frame, self.last_locations, self.last_names
+        names = self.recognize_faces(frame, face_locations, face_encodings)
+        return frame, face_locations, names
+
+    def run(self, source=0, max_frames=None, stop_event=None, on_attach=None, display=False):
         print("[INFO] Starting face recognition...")
         
         # Make sure encodings are loaded
-        if len(self.data["encodings"]) == 0:
+        if self.matcher is self.gallery and len(self.gallery) == 0:
             print("[ERROR] No face encodings loaded. Please run training first.")
             return False
         
         # Initialize video capture
+        self.source = source
         try:
-            self.cap = cv2.VideoCapture(0)
+            with self.profile.phase("open_capture"):
+                self.cap = cv2.VideoCapture(source)
             if not self.cap.isOpened():
                 print("[ERROR] Could not open video capture device")
                 print("[INFO] Make sure your webcam is connected and not in use by another application")
@@ -111,70 +309,67 @@ class FaceRecognizer:
             return False
             
         frames_processed = 0
+        results = self.recognize_stream(self.read_frames(stop_event, on_attach))
         
         try:
-            while max_frames is None or frames_processed < max_frames:
-                ret, frame = self.cap.read()
-                if not ret:
-                    print("[ERROR] Failed to capture frame")
-                    break
+            frame_start = time.perf_counter()
+            for frame, face_locations, names in results:
+                if display or self.preview.active:
+                    # Draw bounding boxes and names on the frame
+                    display_frame = draw_boxes(frame.copy(), face_locations, names)
+                    self.preview.publish(display_frame)
 
-                face_locations, face_encodings = detect_faces(frame)
-                names = []
-
-                for encoding in face_encodings:
-                    matches = face_recognition.compare_faces(self.data["encodings"], encoding, tolerance=0.5)
-                    name = "Unseen"
-                    if True in matches:
-                        idx = matches.index(True)
-                        raw_name = self.data["names"][idx]
-                        name = self.label_map.get(raw_name, raw_name)
-
-                    from zoneinfo import ZoneInfo
-                    timestamp = datetime.now(ZoneInfo("Asia/Kolkata")).strftime("%Y-%m-%d %H:%M:%S")
-
-                    # Convert frame to bytes for BLOB storage
-                    frame_bytes = self.frame_to_bytes(frame)
-
-                    # Insert into DB: name, timestamp, frame blob
-                    try:
-                        self.cursor.execute(
-                            'INSERT INTO face_log (name, timestamp, frame) VALUES (?, ?, ?)',
-                            (name, timestamp, frame_bytes)
-                        )
-                        self.conn.commit()
-                    except Exception as e:
-                        print(f"[ERROR] Failed to insert into database: {e}")
-
-                    names.append(name)
-
-                # Draw bounding boxes and names on the frame
-                display_frame = draw_boxes(frame.copy(), face_locations, names)
-                cv2.imshow("Face Recognition", display_frame)
-
-                # Exit loop if 'q' pressed
-                key = cv2.waitKey(1) & 0xFF
-                if key == ord('q'):
-                    break
+                if display:
+                    cv2.imshow("Face Recognition", display_frame)
+
+                    # Exit loop if 'q' pressed
+                    key = cv2.waitKey(1) & 0xFF
+                    if key == ord('q'):
+                        break
+
+                # Time between delivered frames, which also covers pipelined detection
+                now = time.perf_counter()
+                if self.shedder is not None:
+                    self.shedder.record((now - frame_start) * 1000)
+                frame_start = now
                     
                 frames_processed += 1
+                if max_frames is not None and frames_processed >= max_frames:
+                    break
                 
             return True
         except Exception as e:
             print(f"[ERROR] Exception in recognition loop: {e}")
+            self.events.error("Exception in recognition loop", error=str(e))
             return False
         finally:
+            results.close()
             if self.cap is not None:
                 self.cap.release()
-            cv2.destroyAllWindows()
+                self.cap = None
+            if display:
+                cv2.destroyAllWindows()
             print(f"[INFO] Recognition stopped after processing {frames_processed} frames")
 
 def main():
-    import numpy as np  # Add missing import
+    # Expose load shedding decisions for Prometheus; 5002 belongs to recognition_worker.py
+    metrics_port = int(os.environ.get("RECOGNITION_METRICS_PORT", "5003"))
+    try:
+        start_http_server(metrics_port)
+    except OSError as e:
+        # Metrics are optional for a one-off run, recognition itself is not
+        print(f"[WARNING] Could not serve metrics on port {metrics_port}: {e}")
     recognizer = FaceRecognizer()
-    success = recognizer.run()
+    try:
+        success = recognizer.run(
+            source=parse_source(os.environ.get("RECOGNITION_SOURCE", "0")),
+            display=os.environ.get("RECOGNITION_DISPLAY", "0") == "1"
+        )
+    finally:
+        # Flush queued events before the process exits
+        recognizer.events.close()
     if not success:
         sys.exit(1)  # Exit with error code on failure
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,206 @@
+import os
+import sys
+import shutil
+import tarfile
+import tempfile
+import threading
+import zipfile
+import time
+import logging
+
+from flask import Flask, Response, jsonify, request
+from prometheus_client import make_wsgi_app, Gauge
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
+from werkzeug.serving import run_simple
+
+from ingest import IngestWorker, ingest_archive
+from preview import MIMETYPE
+from recognition_service import FaceRecognizer, parse_source, startup
+
+# Prometheus metrics
+worker_active = Gauge('recognition_worker_active', 'Whether the pre-warmed worker has a source attached (1=attached)')
+
+app = Flask(__name__)
+metrics_app = make_wsgi_app()
+
+# Combine Flask and Prometheus WSGI apps
+application = DispatcherMiddleware(app.wsgi_app, {
+    '/metrics': metrics_app
+})
+
+
+class RecognitionWorker:
+    """Keeps models and gallery loaded and attaches capture sources on demand.
+
+    The recognition loop runs on the main thread (the optional OpenCV window
+    needs it), while the control endpoints only flip events. A start therefore costs
+    opening the capture device and reading one frame, and a stop returns the
+    worker to idle without unloading anything.
+    """
+
+    def __init__(self, recognizer, default_source=0):
+        self.recognizer = recognizer
+        self.default_source = default_source
+        self.lock = threading.Lock()
+        self.start_requested = threading.Event()
+        self.stop_requested = threading.Event()
+        self.attached = threading.Event()
+        self.finished = threading.Event()
+        self.finished.set()
+        self.source = None
+        self.active = False
+
+    def start(self, source=None, timeout=10.0):
+        with self.lock:
+            if self.active:
+                return False, "Recognition already running"
+            self.source = self.default_source if source is None else source
+            self.active = True
+            self.attached.clear()
+            self.finished.clear()
+            self.stop_requested.clear()
+            self.start_requested.set()
+
+        start = time.perf_counter()
+        # Wait until the first frame has been read or the attach failed
+        while not self.attached.wait(0.01):
+            if self.finished.is_set():
+                return False, f"Failed to attach source {self.source}"
+            if time.perf_counter() - start > timeout:
+                return False, f"Timed out attaching source {self.source}"
+        return True, f"Recognition started in {(time.perf_counter() - start) * 1000:.0f}ms"
+
+    def stop(self, timeout=10.0):
+        with self.lock:
+            if not self.active:
+                return False, "Recognition not running"
+            self.stop_requested.set()
+        if not self.finished.wait(timeout):
+            return False, f"Recognition loop did not stop within {timeout:.0f}s"
+        return True, "Recognition stopped"
+
+    def serve_forever(self, display=False):
+        while True:
+            self.start_requested.wait()
+            self.start_requested.clear()
+            worker_active.set(1)
+            try:
+                self.recognizer.run(
+                    source=self.source,
+                    stop_event=self.stop_requested,
+                    on_attach=self.attached.set,
+                    display=display
+                )
+            finally:
+                with self.lock:
+                    self.active = False
+                    self.finished.set()
+                worker_active.set(0)
+
+
+worker = None
+ingest_worker = None
+
+@app.route('/start', methods=['POST'])
+def start():
+    payload = request.get_json(silent=True) or {}
+    source = payload.get("source")
+    ok, message = worker.start(parse_source(source) if source is not None else None)
+    return jsonify({"status": "success" if ok else "error", "message": message}), 200 if ok else 409
+
+@app.route('/stop', methods=['POST'])
+def stop():
+    ok, message = worker.stop()
+    return jsonify({
+        "status": "success" if ok else "error",
+        "message": message,
+        "recognition_active": worker.active
+    }), 200 if ok else 409
+
+@app.route('/status')
+def status():
+    sharded = worker.recognizer.matcher is not worker.recognizer.gallery
+    return jsonify({
+        "recognition_active": worker.active,
+        "source": worker.source,
+        # With RECOGNITION_SHARDS the identities live on the matchers, not in this process
+        "encodings": None if sharded else len(worker.recognizer.gallery),
+        "sharded": sharded,
+        "startup_ms": worker.recognizer.profile.as_dict()
+    })
+
+@app.route('/preview.mjpg')
+def preview():
+    # One generator per viewer; each always sends the newest frame, so slow clients skip frames
+    return Response(worker.recognizer.preview.mjpeg(), mimetype=MIMETYPE,
+                    headers={"Cache-Control": "no-cache, no-store"})
+
+@app.route('/ingest', methods=['POST'])
+def ingest():
+    if ingest_worker is None:
+        # Sharded matchers load their partition once at startup and would never see these identities
+        return jsonify({
+            "status": "error",
+            "message": "Ingest is not available with RECOGNITION_SHARDS; add the images to the training set, "
+                       "retrain and restart the matchers"
+        }), 409
+
+    # Accept a multipart upload or a raw archive body named by X-Archive-Name
+    if 'archive' in request.files:
+        upload = request.files['archive']
+        fileobj, filename = upload.stream, upload.filename
+    else:
+        fileobj = request.stream
+        filename = request.headers.get("X-Archive-Name", "upload.tar")
+        if filename.lower().endswith(".zip"):
+            # Zip needs to seek to its central directory; spool the body, nothing is extracted
+            spooled = tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024)
+            shutil.copyfileobj(request.stream, spooled)
+            spooled.seek(0)
+            fileobj = spooled
+
+    try:
+        queued = ingest_archive(fileobj, filename, ingest_worker)
+    except (tarfile.TarError, zipfile.BadZipFile) as e:
+        logging.error(f"Rejected archive {filename}: {e}")
+        return jsonify({"status": "error", "message": f"Unreadable archive: {e}"}), 400
+
+    if request.args.get("wait") == "1":
+        ingest_worker.join()
+    logging.info(f"Ingested {filename}: {queued} new images queued")
+    return jsonify({
+        "status": "success",
+        "queued": queued,
+        "stats": ingest_worker.stats,
+        "encodings": len(worker.recognizer.gallery)
+    })
+
+def main():
+    global worker, ingest_worker
+    recognizer = FaceRecognizer()
+    recognizer.warm_up()
+    startup.report()
+
+    worker = RecognitionWorker(recognizer, parse_source(os.environ.get("RECOGNITION_SOURCE", "0")))
+    # New identities are encoded as they arrive and matched against immediately; only
+    # the local gallery can take them, sharded matching has no gallery in this process
+    if recognizer.matcher is recognizer.gallery:
+        ingest_worker = IngestWorker(recognizer.gallery, recognizer.encodings_path)
+    else:
+        logging.warning("RECOGNITION_SHARDS is set, /ingest is disabled")
+
+    port = int(os.environ.get("RECOGNITION_WORKER_PORT", "5002"))
+    logging.info(f"Pre-warmed recognition worker listening on http://0.0.0.0:{port}")
+    threading.Thread(target=lambda: run_simple('0.0.0.0', port, application, threaded=True), daemon=True).start()
+
+    if os.environ.get("RECOGNITION_AUTOSTART") == "1":
+        threading.Thread(target=worker.start, daemon=True).start()
+
+    # The annotated stream is served at /preview.mjpg; an X11 window is opt-in for local debugging
+    worker.serve_forever(display=os.environ.get("RECOGNITION_DISPLAY", "0") == "1")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,373 @@
+import argparse
+import hashlib
+import hmac
+import heapq
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import re
+import secrets
+import select
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+from prometheus_client import Counter, Histogram
+
+from compact_gallery import CompactGallery
+from gallery import ENCODING_SIZE, Gallery
+
+# Prometheus metrics
+shard_timeouts = Counter('matcher_shard_timeouts_total', 'Scatter requests a shard did not answer in time', ['shard'])
+shard_errors = Counter('matcher_shard_errors_total', 'Scatter requests that failed on a shard connection', ['shard'])
+scatter_latency = Histogram('matcher_scatter_seconds', 'Time to scatter a batch and gather all shard results')
+
+DEFAULT_PORT = 6000
+
+# Wire format, no pickle anywhere: every message is a 4-byte big-endian length
+# followed by the payload. A request payload is REQUEST_HEADER
+# (request id, k, query count) followed by the queries as raw float32; a reply
+# is REPLY_HEADER (request id) followed by UTF-8 JSON [[[distance, label], ...], ...].
+LENGTH = struct.Struct(">I")
+REQUEST_HEADER = struct.Struct(">QII")
+REPLY_HEADER = struct.Struct(">Q")
+NONCE_BYTES = 32
+MAX_QUERIES = 4096
+MAX_K = 100
+MAX_MESSAGE = REQUEST_HEADER.size + MAX_QUERIES * ENCODING_SIZE * 4
+
+
+def authkey():
+    key = os.environ.get("SHARD_AUTHKEY")
+    if not key:
+        raise RuntimeError("SHARD_AUTHKEY is not set; matchers and their clients need a shared secret")
+    return key.encode("utf-8")
+
+def parse_addresses(value):
+    # "host:port,host:port" -> [(host, port), ...]
+    addresses = []
+    for item in value.split(","):
+        host, _, port = item.strip().rpartition(":")
+        addresses.append((host, int(port)))
+    return addresses
+
+
+def _recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError("connection closed")
+        data.extend(chunk)
+    return bytes(data)
+
+def _recv_message(sock, max_size=MAX_MESSAGE):
+    (size,) = LENGTH.unpack(_recv_exact(sock, LENGTH.size))
+    if size > max_size:
+        raise ConnectionError(f"message of {size} bytes exceeds the {max_size} byte limit")
+    return _recv_exact(sock, size)
+
+def _send_message(sock, payload):
+    sock.sendall(LENGTH.pack(len(payload)) + payload)
+
+def _signature(key, nonce):
+    return hmac.new(key, nonce, hashlib.sha256).digest()
+
+def encode_request(request_id, queries, k):
+    queries = np.ascontiguousarray(queries, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+    return REQUEST_HEADER.pack(request_id, k, len(queries)) + queries.tobytes()
+
+def decode_request(payload):
+    request_id, k, count = REQUEST_HEADER.unpack_from(payload)
+    body = payload[REQUEST_HEADER.size:]
+    if count > MAX_QUERIES or not 0 < k <= MAX_K or len(body) != count * ENCODING_SIZE * 4:
+        raise ValueError("malformed request")
+    queries = np.frombuffer(body, dtype=np.float32).reshape(count, ENCODING_SIZE).astype(np.float64)
+    return request_id, queries, k
+
+def encode_reply(request_id, results):
+    return REPLY_HEADER.pack(request_id) + json.dumps(results).encode("utf-8")
+
+def decode_reply(payload):
+    (request_id,) = REPLY_HEADER.unpack_from(payload)
+    results = json.loads(payload[REPLY_HEADER.size:].decode("utf-8"))
+    return request_id, [[(float(distance), label) for distance, label in candidates] for candidates in results]
+
+
+def _handle(sock, gallery, key, shard):
+    try:
+        # Challenge-response on the shared key before any request is read
+        sock.settimeout(5.0)
+        nonce = secrets.token_bytes(NONCE_BYTES)
+        _send_message(sock, nonce)
+        if not hmac.compare_digest(_recv_message(sock, NONCE_BYTES * 2), _signature(key, nonce)):
+            logging.warning(f"Shard {shard} rejected a client with the wrong key")
+            return
+        _send_message(sock, b"ok")
+        sock.settimeout(None)
+
+        while True:
+            request_id, queries, k = decode_request(_recv_message(sock))
+            _send_message(sock, encode_reply(request_id, gallery.topk(queries, k)))
+    except (EOFError, OSError, ValueError, struct.error) as e:
+        if not isinstance(e, EOFError):
+            logging.warning(f"Shard {shard} dropped a client: {e}")
+    finally:
+        sock.close()
+
+def serve(gallery, address, shard=0):
+    """Answer top-k requests for one gallery shard, one thread per authenticated client."""
+    key = authkey()
+    listener = socket.create_server(address)
+    logging.info(f"Shard {shard} serving {len(gallery)} encodings on {address[0]}:{address[1]}")
+    while True:
+        sock, _ = listener.accept()
+        threading.Thread(target=_handle, args=(sock, gallery, key, shard), daemon=True).start()
+
+def connect(address, key, timeout=1.0):
+    """Open an authenticated connection to a shard; connect and handshake are bounded by timeout."""
+    sock = socket.create_connection(address, timeout=timeout)
+    try:
+        nonce = _recv_message(sock, NONCE_BYTES)
+        _send_message(sock, _signature(key, nonce))
+        if _recv_message(sock, 16) != b"ok":
+            raise ConnectionError("handshake refused")
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+class _ShardConnection:
+    """One shard socket; buffers partial replies so a timed out read never breaks the framing."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = bytearray()
+
+    def send(self, payload):
+        _send_message(self.sock, payload)
+
+    def recv(self, timeout):
+        """Return the next complete reply payload, or None if none arrives within timeout."""
+        deadline = time.perf_counter() + timeout
+        while True:
+            if len(self.buffer) >= LENGTH.size:
+                (size,) = LENGTH.unpack_from(self.buffer)
+                if len(self.buffer) >= LENGTH.size + size:
+                    payload = bytes(self.buffer[LENGTH.size:LENGTH.size + size])
+                    del self.buffer[:LENGTH.size + size]
+                    return payload
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 or not select.select([self.sock], [], [], remaining)[0]:
+                return None
+            chunk = self.sock.recv(1 << 16)
+            if not chunk:
+                raise EOFError("connection closed")
+            self.buffer.extend(chunk)
+
+    def close(self):
+        self.sock.close()
+
+
+def _serve_partition(encodings_path, shard, shards, address, mode="float64"):
+    logging.basicConfig(
+        level=logging.INFO,
+        format='[%(asctime)s] %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    gallery = Gallery.load(encodings_path).partition(shard, shards)
+    if not len(gallery):
+        # Few identities can all hash to other shards
+        logging.warning(f"Shard {shard} of {shards} has no identities, serving an empty gallery")
+    if mode != "float64":
+        gallery = CompactGallery.from_gallery(gallery, mode=mode)
+    serve(gallery, address, shard)
+
+
+class ShardedMatcher:
+    """Scatters face encodings to every gallery shard and merges their top-k results.
+
+    Each shard gets the whole batch of a frame in one message. Shards that
+    don't answer within `timeout` seconds are left out of that frame's
+    merge; their late replies are recognized by request id and dropped.
+    A shard whose connection fails is marked down and skipped; a background
+    thread reconnects it with exponential backoff, so the inference thread
+    never waits on a connect or handshake.
+    """
+
+    def __init__(self, addresses, timeout=0.05, k=3, connect_timeout=1.0, max_backoff=30.0):
+        self.addresses = addresses
+        self.timeout = timeout
+        self.k = k
+        self.connect_timeout = connect_timeout
+        self.max_backoff = max_backoff
+        self.key = authkey()
+        self.conns = [None] * len(addresses)
+        self._ids = itertools.count()
+        self._lost = threading.Event()
+        self._closed = threading.Event()
+        # First attempt happens here, at startup, so the first frames already see every live shard
+        for shard in range(len(addresses)):
+            self._try_connect(shard)
+        self._reconnector = threading.Thread(target=self._reconnect_loop, daemon=True)
+        self._reconnector.start()
+
+    def _try_connect(self, shard):
+        try:
+            self.conns[shard] = _ShardConnection(connect(self.addresses[shard], self.key, self.connect_timeout))
+            logging.info(f"Connected to shard {shard} at {self.addresses[shard]}")
+            return True
+        except (OSError, EOFError, ConnectionError) as e:
+            logging.warning(f"Shard {shard} at {self.addresses[shard]} unavailable: {e}")
+            return False
+
+    def _reconnect_loop(self):
+        backoff = [0.5] * len(self.addresses)
+        next_attempt = [0.0] * len(self.addresses)
+        while not self._closed.is_set():
+            now = time.monotonic()
+            for shard, conn in enumerate(self.conns):
+                if conn is not None:
+                    backoff[shard] = 0.5
+                    continue
+                if now < next_attempt[shard]:
+                    continue
+                if not self._try_connect(shard):
+                    next_attempt[shard] = now + backoff[shard]
+                    backoff[shard] = min(backoff[shard] * 2, self.max_backoff)
+            down = [next_attempt[shard] for shard, conn in enumerate(self.conns) if conn is None]
+            wait = max(0.0, min(down) - time.monotonic()) if down else None
+            self._lost.wait(wait)
+            self._lost.clear()
+
+    def _drop(self, shard):
+        conn = self.conns[shard]
+        if conn is not None:
+            self.conns[shard] = None
+            conn.close()
+            self._lost.set()
+
+    def topk(self, encodings, k=None):
+        k = k or self.k
+        if not len(encodings):
+            return []
+        request_id = next(self._ids)
+        start = time.perf_counter()
+        payload = encode_request(request_id, encodings, k)
+
+        sent = []
+        for shard, conn in enumerate(self.conns):
+            if conn is None:
+                # Marked down, the reconnect thread brings it back
+                continue
+            try:
+                conn.sock.settimeout(self.timeout)
+                conn.send(payload)
+                sent.append((shard, conn))
+            except OSError as e:
+                logging.warning(f"Shard {shard} at {self.addresses[shard]} unavailable: {e}")
+                shard_errors.labels(shard=str(shard)).inc()
+                self._drop(shard)
+
+        merged = [[] for _ in range(len(encodings))]
+        deadline = start + self.timeout
+        for shard, conn in sent:
+            try:
+                while True:
+                    reply = conn.recv(max(deadline - time.perf_counter(), 0))
+                    if reply is None:
+                        logging.warning(f"Shard {shard} timed out after {self.timeout * 1000:.0f}ms")
+                        shard_timeouts.labels(shard=str(shard)).inc()
+                        break
+                    reply_id, results = decode_reply(reply)
+                    if reply_id == request_id:
+                        for i, candidates in enumerate(results):
+                            merged[i].extend(candidates)
+                        break
+                    # Otherwise a late reply to an earlier request; skip it
+            except (OSError, EOFError, ValueError, struct.error) as e:
+                logging.warning(f"Shard {shard} connection lost: {e}")
+                shard_errors.labels(shard=str(shard)).inc()
+                self._drop(shard)
+
+        scatter_latency.observe(time.perf_counter() - start)
+        return [heapq.nsmallest(k, candidates) for candidates in merged]
+
+    def match_batch(self, encodings, tolerance=0.5):
+        """Return the nearest label within tolerance for every encoding, or None."""
+        names = []
+        for candidates in self.topk(encodings):
+            if candidates and candidates[0][0] <= tolerance:
+                names.append(candidates[0][1])
+            else:
+                names.append(None)
+        return names
+
+    def close(self):
+        self._closed.set()
+        self._lost.set()
+        for shard in range(len(self.conns)):
+            self._drop(shard)
+
+
+def spawn_local(encodings_path, shards, host="127.0.0.1", base_port=DEFAULT_PORT, mode="float64"):
+    """Start one matcher process per shard on this machine; returns (processes, addresses)."""
+    # Local benchmark runs get a throwaway key; child processes inherit it through the environment
+    os.environ.setdefault("SHARD_AUTHKEY", secrets.token_hex(16))
+    key = authkey()
+    addresses = [(host, base_port + shard) for shard in range(shards)]
+    processes = []
+    for shard, address in enumerate(addresses):
+        process = multiprocessing.Process(
+            target=_serve_partition, args=(encodings_path, shard, shards, address, mode), daemon=True
+        )
+        process.start()
+        processes.append(process)
+
+    # Wait for every listener to come up before handing out the addresses
+    for address in addresses:
+        deadline = time.time() + 30
+        while True:
+            try:
+                connect(address, key).close()
+                break
+            except (OSError, EOFError):
+                if time.time() > deadline:
+                    raise RuntimeError(f"Matcher at {address} did not start")
+                time.sleep(0.1)
+    return processes, addresses
+
+def shard_from_hostname():
+    # StatefulSet pods are named <name>-<ordinal>
+    match = re.search(r'-(\d+)$', socket.gethostname())
+    return int(match.group(1)) if match else 0
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='[%(asctime)s] %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    parser = argparse.ArgumentParser(description="Serve one identity shard of the face gallery")
+    parser.add_argument("--shards", type=int, default=int(os.environ.get("SHARD_COUNT", "1")))
+    parser.add_argument("--shard", type=int, default=None,
+                        help="Shard index (default: SHARD_INDEX or the pod ordinal in the hostname)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--encodings", default="/app/models/encodings.pkl")
+    parser.add_argument("--mode", choices=["float64", "float16", "int8", "pq"],
+                        default=os.environ.get("GALLERY_MODE", "float64"), help="In-memory gallery representation")
+    args = parser.parse_args()
+
+    shard = args.shard
+    if shard is None:
+        shard = int(os.environ["SHARD_INDEX"]) if "SHARD_INDEX" in os.environ else shard_from_hostname()
+    _serve_partition(args.encodings, shard, args.shards, ("0.0.0.0", args.port), args.mode)
+
+if __name__ == "__main__":
+    main()
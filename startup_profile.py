@@ -0,0 +1,36 @@
+import logging
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Gauge
+
+# Prometheus metrics
+startup_seconds = Gauge('recognition_startup_seconds', 'Time spent in each recognition startup phase', ['phase'])
+
+
+class StartupProfile:
+    """Records how long each phase of bringing up recognition takes."""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        self.phases[name] = seconds
+        startup_seconds.labels(phase=name).set(seconds)
+
+    def as_dict(self):
+        return {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()}
+
+    def report(self):
+        total = time.perf_counter() - self.origin
+        breakdown = ", ".join(f"{name}={ms}ms" for name, ms in self.as_dict().items())
+        logging.info(f"Startup breakdown ({total * 1000:.1f}ms since launch): {breakdown}")
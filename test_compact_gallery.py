@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from compact_gallery import CODECS, CompactGallery
+from gallery import Gallery, shard_for
+
+
+def identities(count, seed=0):
+    # One well separated encoding per identity, roughly shaped like dlib descriptors
+    rng = np.random.default_rng(seed)
+    return rng.normal(0, 0.09, size=(count, 128))
+
+
+@pytest.mark.parametrize("mode", list(CODECS))
+def test_identities_added_one_at_a_time_from_empty(mode):
+    encodings = identities(10)
+    gallery = CompactGallery(mode=mode)
+    for i, encoding in enumerate(encodings):
+        gallery.add([encoding], [str(i)])
+
+    assert gallery.match_batch(encodings, tolerance=0.1) == [str(i) for i in range(10)]
+    distances = [candidates[0][0] for candidates in gallery.topk(encodings, 1)]
+    assert max(distances) < 0.1
+
+
+@pytest.mark.parametrize("mode", list(CODECS))
+def test_identities_added_after_a_small_gallery(mode):
+    encodings = identities(10)
+    gallery = CompactGallery(encodings[:2], ["0", "1"], mode=mode)
+    for i in range(2, 10):
+        gallery.add([encodings[i]], [str(i)])
+
+    assert gallery.match_batch(encodings, tolerance=0.1) == [str(i) for i in range(10)]
+
+
+@pytest.mark.parametrize("mode", ["int8", "pq"])
+def test_growing_gallery_is_retrained(mode):
+    encodings = identities(3000)
+    names = [str(i) for i in range(len(encodings))]
+    gallery = CompactGallery(mode=mode)
+    for start in range(0, len(encodings), 50):
+        gallery.add(encodings[start:start + 50], names[start:start + 50])
+
+    codec, codes, tail = gallery._snapshot[0]
+    assert codec is not None
+    # Only the rows added since the last retrain are still held at full precision
+    assert len(tail) < len(encodings) * 0.2
+    reference = Gallery(encodings, names).topk(encodings[:200], 1)
+    found = gallery.topk(encodings[:200], 1)
+    assert np.mean([a[0][1] == b[0][1] for a, b in zip(found, reference)]) > 0.95
+
+
+@pytest.mark.parametrize("mode", list(CODECS))
+def test_partition_keeps_coded_rows_and_tail(mode):
+    encodings = identities(1100)
+    names = [str(i) for i in range(len(encodings))]
+    gallery = CompactGallery(encodings[:1024], names[:1024], mode=mode)
+    gallery.add(encodings[1024:], names[1024:])
+
+    queries = identities(20, seed=1)
+    full = gallery._squared_distances(gallery._snapshot[0], queries)
+    for shard in range(3):
+        part = gallery.partition(shard, 3)
+        keep = [i for i, name in enumerate(names) if shard_for(name, 3) == shard]
+        assert part.names == [names[i] for i in keep]
+        # Same codes and codec, so the same distances as the rows in the full gallery
+        assert np.allclose(part._squared_distances(part._snapshot[0], queries), full[:, keep])
+
+
+def test_empty_gallery_matches_nothing():
+    for mode in CODECS:
+        gallery = CompactGallery(mode=mode)
+        assert gallery.match(identities(1)[0]) is None
+        assert gallery.topk(identities(2), 1) == [[], []]
+        assert gallery.memory_bytes() == 0
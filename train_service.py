@@ -1,4 +1,6 @@
 import face_recognition
+import hashlib
+import io
 import os
 import pickle
 import numpy as np
@@ -43,6 +45,7 @@ def extract_label_from_dirname(dirname):
 def train():
     known_encodings = []
     known_names = []
+    known_hashes = []
 
     data_dir = "/app/data"
     output_dir = "/app/models"
@@ -83,11 +86,15 @@ def train():
             path = os.path.join(person_dir, img_name)
             try:
                 logging.debug(f"Processing image {img_name}")
-                image = face_recognition.load_image_file(path)
+                with open(path, "rb") as f:
+                    raw = f.read()
+                image = face_recognition.load_image_file(io.BytesIO(raw))
                 encs = face_recognition.face_encodings(image)
                 if encs:
                     known_encodings.append(encs[0])
                     known_names.append(label)
+                    # Content hashes let archive ingestion skip images that are already trained
+                    known_hashes.append(hashlib.sha256(raw).hexdigest())
                     total_images += 1
                     images_processed.inc()
                     logging.debug(f"Encoded image {img_name}")
@@ -103,7 +110,7 @@ def train():
 
     encodings_path = os.path.join(output_dir, "encodings.pkl")
     with open(encodings_path, "wb") as f:
-        pickle.dump({"encodings": known_encodings, "names": known_names}, f)
+        pickle.dump({"encodings": known_encodings, "names": known_names, "hashes": known_hashes}, f)
 
     logging.info(f"Saved {encodings_path} with {total_images} images.")
     logging.info(f"Training complete on {total_images} images across {len(set(known_names))} classes.")
@@ -15,12 +15,13 @@ try:
     conn = sqlite3.connect('face_log.db')
     cursor = conn.cursor()
 
-    cursor.execute("SELECT id, name, timestamp, frame FROM face_log ORDER BY id DESC")
-    records = cursor.fetchall()
+    count = cursor.execute("SELECT COUNT(*) FROM face_log").fetchone()[0]
+    logging.info(f"Found {count} records.")
 
-    logging.info(f"Found {len(records)} records.")
+    # Iterate the cursor instead of fetchall() so only one frame blob is held at a time
+    cursor.execute("SELECT id, name, timestamp, frame FROM face_log ORDER BY id DESC")
 
-    for record in records:
+    for record in cursor:
         id, name, timestamp, frame_bytes = record
 
         logging.info(f"ID: {id}, Name: {name}, Timestamp: {timestamp}")